@@ -1,25 +1,47 @@
 import sched
 import time
+from datetime import timedelta
 
 import pendulum
 import telebot
-from flask import Flask, abort, request, current_app
+from flask import Flask, abort, current_app, jsonify, request
 from flask_api import status
 from flask_debugtoolbar import DebugToolbarExtension
 from flask_sqlalchemy import SQLAlchemy
 
-from helpers import PhantomJSThreadPool
+from helpers import (PhantomJSThreadPool, RequestScopes, SingleFlight,
+                     UpdatesDeduplicator, UpdatesProcessor, json_decode)
+from parsers import create_phantom_entity
+from refreshers import ScheduleRefresher
 from settings import ConfiguratorFactory, Phase, constants, logger
 
 """ Main module of the telegram bot
     to integrate with the ACS service
 """
-telegram = telebot.TeleBot(token=constants.API_TOKEN)
+# in async mode the updates workers run the handlers themselves
+telegram = telebot.TeleBot(token=constants.API_TOKEN,
+                           threaded=not constants.WEBHOOK_ASYNC_MODE)
 server = Flask(__name__)
 
 db = SQLAlchemy()
 debugger = DebugToolbarExtension()
-phantom_thread_pool = PhantomJSThreadPool(constants.PHANTOMJS_THREADS_COUNT)
+# every handler call and pool goal runs in its own context and session
+request_scopes = RequestScopes(server, db)
+phantom_thread_pool = PhantomJSThreadPool(
+        constants.PHANTOMJS_THREADS_COUNT,
+        drivers_factory=create_phantom_entity \
+            if constants.ACS_PARSER_ENGINE == 'phantom' else None,
+        scope=request_scopes)
+scrape_flights = SingleFlight(timeout=constants.SCRAPE_FLIGHT_TIMEOUT)
+
+schedule_refresher = ScheduleRefresher(
+        phantom_thread_pool,
+        scrape_flights,
+        cron=constants.SCHEDULE_REFRESH_CRON,
+        window=timedelta(hours=constants.SCHEDULE_REFRESH_WINDOW_HOURS),
+        rate=constants.SCHEDULE_REFRESH_RATE,
+        margin=timedelta(hours=constants.SCHEDULE_REFRESH_MARGIN_HOURS),
+        batch=constants.SCHEDULE_REFRESH_BATCH)
 
 choosed_configurator = ConfiguratorFactory.create_configurator(
         Phase.DEVELOPMENT.value)
@@ -41,17 +63,55 @@ def set_webhook(telegram):
 def index():
     return (u"* Connected!", status.HTTP_200_OK)
 
+def process_update(json_update):
+    update = telebot.types.Update.de_json(json_update)
+    telegram.process_new_updates([update])
+
+updates_deduplicator = UpdatesDeduplicator(
+        window=constants.UPDATES_DEDUP_WINDOW,
+        limit=constants.UPDATES_DEDUP_LIMIT)
+
+updates_processor = UpdatesProcessor(
+        process_update,
+        lanes_n=constants.WEBHOOK_LANES_COUNT,
+        queue_size=constants.WEBHOOK_QUEUE_SIZE) if constants.WEBHOOK_ASYNC_MODE else None
+
 @server.route(constants.WEBHOOK_URL_PATH, methods=['POST'])
 def webhook():
     if request.headers.get('content-type') == 'application/json':
-        json_string = request.get_data().decode('utf-8')
-        update = telebot.types.Update.de_json(json_string)
- 
-        telegram.process_new_updates([update])
+        json_update = json_decode(request.get_data())
+        if not isinstance(json_update, dict) or 'update_id' not in json_update:
+            abort(status.HTTP_400_BAD_REQUEST)
+        if updates_deduplicator.seen(json_update['update_id']):
+            # re-delivery of the update already taken, acknowledge and drop
+            return (u"* Webhook!", status.HTTP_200_OK)
+
+        if not updates_processor:
+            try:
+                process_update(json_update)
+            except Exception:
+                updates_deduplicator.forget(json_update['update_id'])
+                raise
+        elif not updates_processor.submit(json_update):
+            # the handlers run in the updates workers, when they
+            # are overloaded telegram delivers the update again later
+            updates_deduplicator.forget(json_update['update_id'])
+            abort(status.HTTP_503_SERVICE_UNAVAILABLE)
         return (u"* Webhook!", status.HTTP_200_OK)
     else:
         abort(status.HTTP_403_FORBIDDEN)
 
+@server.route(f'{constants.WEBHOOK_URL_PATH}stats', methods=['GET'])
+def webhook_stats():
+    stats = {}
+    if updates_processor:
+        stats['updates'] = {
+            'depth': updates_processor.depth, 'lanes': updates_processor.depths}
+    from templates import rendered_views
+    stats['views'] = rendered_views.stats
+    stats['scopes'] = request_scopes.stats
+    return (jsonify(stats), status.HTTP_200_OK)
+
 try:
     """ Connect your SQLAlchemy object to your application
     """
@@ -71,6 +131,9 @@ try:
         constants.WEBHOOK_SETUP_PRIORITY, set_webhook, (telegram,)
     )
     scheduler.run()
+    """ Refresh schedules in the off-peak window
+    """
+    if constants.SCHEDULE_REFRESH_ENABLED: schedule_refresher.start()
     logger.debug('* Telegram bot: get starting command!')
 except Exception as error:
     logger.exception(f'{error}')
@@ -79,6 +142,11 @@ except Exception as error:
     raise SystemExit(f'{time_str}\u0020{text_str}')
 
 from handlers.views.profiles import *
+if constants.UPDATES_DEDUP_DATABASE:
+    """ Share the taken updates between the processes
+    """
+    from handlers.models.profiles import ProcessedUpdateModel
+    updates_deduplicator.backend = ProcessedUpdateModel
 if __name__ == '__main__':
     if server.config['DEBUG']:
         server.run(
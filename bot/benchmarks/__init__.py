@@ -0,0 +1,3 @@
+""" Offline benchmarks of the ACS parsers, replayed against
+    recorded (anonymised) ACS pages served by a local stand-in.
+"""
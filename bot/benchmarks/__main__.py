@@ -0,0 +1,175 @@
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+from benchmarks.server import ACSStandIn
+from parsers import ACSHttpEngine, ACSParser
+
+""" Benchmark of the ACS parsers against recorded pages
+
+    Every parser is split into the stages of a real scrape:
+    login (form post), navigation (sidebar link, page load and
+    cutting out the table/tab), extraction (BeautifulSoup) and
+    save (JSON serialisation the JSON column does on UPDATE).
+    Time is the median of --repeat runs, peak memory is taken
+    from a separate run under tracemalloc.
+
+    Usage:
+        Example 1:
+        # Measure all fixture sizes and print the report
+
+        > python -m benchmarks
+
+        Example 2:
+        # Store the report as the new baseline
+
+        > python -m benchmarks --save
+
+        Example 3:
+        # Regression gate, exit code 1 when a stage is slower or
+        # takes more memory than the baseline plus tolerance
+
+        > python -m benchmarks --check --tolerance=0.5
+"""
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures')
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'baseline.json')
+SIZES = ('small', 'medium', 'large')
+STAGES = ('login', 'navigation', 'extraction', 'save')
+# differences below these are measurement noise, not regressions
+NOISE_FLOOR = {'seconds': 0.002, 'peak_bytes': 16 * 1024}
+
+CREDENTIALS = {'id': 1, 'username': 'student', 'password': 'secret'}
+
+
+def load_fixtures(size):
+    fixtures = {}
+    for name in ('time', 'student'):
+        with open(os.path.join(FIXTURES_DIR, f'{name}_{size}.html'), encoding='utf-8') as fixture:
+            fixtures[name] = fixture.read()
+    return fixtures
+
+
+def scrape_stages(engine, parser, parser_type):
+    """ Stages of one scrape as (name, callable) pairs, every
+        callable gets the result of the previous stage
+    """
+    session = engine._create_session()
+    href_part = 'self/time' if parser_type == 'schedule' else 'self/student'
+    tab = ACSParser._tabs.get(parser_type)
+
+    def navigation(landing):
+        response = engine._request(session, 'GET',
+                                   engine.sidebar_links(landing).get(href_part),
+                                   params={'year': 2018, 'sem': 0})
+        if parser_type == 'schedule':
+            return engine.time_markup(response)
+        return engine.tabs_markup(response, (tab, )).get(tab)
+
+    return session, (
+        ('login',      lambda _: engine.sign_in(session, **CREDENTIALS)),
+        ('navigation', navigation),
+        ('extraction', getattr(parser, f'extract_{parser_type}')),
+        ('save',       json.dumps),
+    )
+
+
+def run_scrape(engine, parser, parser_type, traced=False):
+    session, stages = scrape_stages(engine, parser, parser_type)
+    result = {}
+    with session:
+        value = None
+        for stage, stage_function in stages:
+            if traced: tracemalloc.start()
+            started = time.perf_counter()
+            value = stage_function(value)
+            result[stage] = {'seconds': time.perf_counter() - started}
+            if traced:
+                _, result[stage]['peak_bytes'] = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+    return result
+
+
+def run(sizes, repeat):
+    engine, parser = ACSHttpEngine(), ACSParser(engine='http')
+    report = {}
+    for size in sizes:
+        with ACSStandIn(load_fixtures(size)):
+            report[size] = {}
+            for parser_type in ('schedule', 'rating', 'module'):
+                run_scrape(engine, parser, parser_type)  # warm up
+                timings = [run_scrape(engine, parser, parser_type) for _ in range(repeat)]
+                traced = run_scrape(engine, parser, parser_type, traced=True)
+                report[size][parser_type] = {
+                    stage: {
+                        'seconds': statistics.median(item[stage]['seconds'] for item in timings),
+                        'peak_bytes': traced[stage]['peak_bytes'],
+                    } for stage in STAGES
+                }
+    return report
+
+
+def print_report(report, baseline={}):
+    print(f"{'size':<8}{'parser':<10}{'stage':<12}{'ms':>10}{'baseline':>10}{'peak KiB':>10}")
+    for size, parsers in report.items():
+        for parser_type, stages in parsers.items():
+            for stage, value in stages.items():
+                base = baseline.get(size, {}).get(parser_type, {}).get(stage, {})
+                base_ms = f"{base['seconds'] * 1000:.2f}" if base else '-'
+                print(f"{size:<8}{parser_type:<10}{stage:<12}"
+                      f"{value['seconds'] * 1000:>10.2f}{base_ms:>10}"
+                      f"{value['peak_bytes'] / 1024:>10.1f}")
+
+
+def regressions(report, baseline, tolerance):
+    """ Stages slower or hungrier than the baseline plus tolerance
+    """
+    found = []
+    for size, parsers in report.items():
+        for parser_type, stages in parsers.items():
+            for stage, value in stages.items():
+                base = baseline.get(size, {}).get(parser_type, {}).get(stage)
+                if not base: continue
+                for metric in ('seconds', 'peak_bytes'):
+                    if value[metric] > base[metric] * (1 + tolerance) and \
+                       value[metric] - base[metric] > NOISE_FLOOR.get(metric):
+                        found.append(f'{size}/{parser_type}/{stage}: {metric} '
+                                     f'{value[metric]:.6g} > {base[metric]:.6g}')
+    return found
+
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(prog='python -m benchmarks')
+    arguments.add_argument('--sizes', nargs='+', choices=SIZES, default=list(SIZES))
+    arguments.add_argument('--repeat', type=int, default=5)
+    arguments.add_argument('--baseline', default=BASELINE_FILE)
+    arguments.add_argument('--tolerance', type=float, default=0.5)
+    arguments.add_argument('--save', action='store_true')
+    arguments.add_argument('--check', action='store_true')
+    options = arguments.parse_args(argv)
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
+
+    baseline = {}
+    if os.path.exists(options.baseline):
+        with open(options.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    report = run(options.sizes, options.repeat)
+    print_report(report, baseline)
+
+    if options.save:
+        with open(options.baseline, 'w') as baseline_file:
+            json.dump(report, baseline_file, indent=2, sort_keys=True)
+    if options.check:
+        found = regressions(report, baseline, options.tolerance)
+        for item in found: print(f'* Regression: {item}', file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import threading
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+from settings import constants
+
+""" Stand-in for the ACS web server, serves the login
+    form, the landing page with the sidebar and the
+    recorded 'self/time' and 'self/student' fixtures
+"""
+SESSION_COOKIE = 'PHPSESSID'
+SESSION_VALUE = 'benchmark'
+
+PAGE = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>ACS</title></head>
+<body><div id="sidebar"><ul>
+<li><a href="/self/time">Schedule</a></li>
+<li><a href="/self/student">Student</a></li>
+</ul></div><div id="content">{content}</div></body></html>'''
+
+LOGIN = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Login</title></head>
+<body><form id="login-form" action="/site/login" method="post">
+<input type="hidden" name="_csrf" value="YmVuY2htYXJr">
+<input type="text" id="loginform-username" name="LoginForm[username]" value="">
+<input type="password" id="loginform-password" name="LoginForm[password]" value="">
+<input type="hidden" name="LoginForm[rememberMe]" value="0">
+<button type="submit" id="login-button">Login</button>
+</form></body></html>'''
+
+
+class ACSRequestHandler(BaseHTTPRequestHandler):
+    """ Routes of the stand-in, a session cookie is
+        required everywhere except the login form
+    """
+    fixtures = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def _signed_in(self):
+        cookie = SimpleCookie(self.headers.get('Cookie', str()))
+        return SESSION_COOKIE in cookie and \
+            cookie[SESSION_COOKIE].value == SESSION_VALUE
+
+    def _send(self, status, body=str(), headers={}):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items(): self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/site/login':
+            return self._send(200, LOGIN)
+        if not self._signed_in():
+            return self._send(302, headers={'Location': '/site/login'})
+        if path == '/self/time':
+            return self._send(200, PAGE.format(content=(
+                f"<table id=\"time\" class=\"table\">{self.fixtures.get('time')}</table>")))
+        if path == '/self/student':
+            return self._send(200, PAGE.format(content=self.fixtures.get('student')))
+        return self._send(200, PAGE.format(content=str()))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode('utf-8'))
+        if form.get('LoginForm[username]') and form.get('LoginForm[password]') \
+           and form.get('_csrf'):
+            return self._send(302, headers={
+                'Location': '/', 'Set-Cookie': f'{SESSION_COOKIE}={SESSION_VALUE}; Path=/'})
+        return self._send(200, LOGIN)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ACSStandIn(object):
+    """ Run the stand-in in a background thread and point
+        constants.ACS_BASE_URL to it for the lifetime of the context
+    """
+    def __init__(self, fixtures):
+        handler = type('FixturesRequestHandler', (ACSRequestHandler, ),
+                       {'fixtures': fixtures})
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.base_url = constants.ACS_BASE_URL
+        host, port = self.server.server_address
+        constants.ACS_BASE_URL = f'http://{host}:{port}'
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        constants.ACS_BASE_URL = self.base_url
+        self.server.shutdown()
+        self.server.server_close()
@@ -87,4 +87,17 @@ class LoadDataCommand(Command):
         finally:
             cursor.close()
         
-        connect.close()
\ No newline at end of file
+        connect.close()
+
+
+class RefreshSchedulesCommand(Command):
+    """ Command to refresh the expiring schedules right now,
+        outside of the off-peak window, resuming an interrupted run
+
+        Usage:
+            > python manage.py refresh
+    """
+    def run(self):
+        from application import schedule_refresher
+        schedule_refresher.run(force=True)
+        schedule_refresher.thread_pool.wait_completion()
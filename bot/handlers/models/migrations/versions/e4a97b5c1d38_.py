@@ -0,0 +1,61 @@
+"""empty message
+
+Revision ID: e4a97b5c1d38
+Revises: c82e4d17fa30
+Create Date: 2026-10-18 13:21:40.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a97b5c1d38'
+down_revision = 'c82e4d17fa30'
+branch_labels = None
+depends_on = None
+
+# json columns moved to jsonb through new columns. The new column is
+# added and backfilled by id ranges outside of the migration transaction,
+# a commit per batch, so no lock is held over the whole copy. The rows
+# the bot wrote meanwhile are copied again under a short lock, then the
+# columns are swapped
+JSONB_COLUMNS = {'user_schedule': ('schedule', ), 'user_rating': ('rating', 'module')}
+BATCH_SIZE = 1000
+
+
+def copy_in_batches(table, assignments):
+    connection = op.get_bind()
+    max_id = connection.execute(sa.text(f'SELECT max(id) FROM {table}')).scalar() or 0
+    for start in range(0, max_id, BATCH_SIZE):
+        connection.execute(
+            sa.text(f'UPDATE {table} SET {assignments} WHERE id > :start AND id <= :finish'),
+            start=start, finish=start + BATCH_SIZE)
+
+
+def convert(column_type, suffix, type_name):
+    for table, columns in JSONB_COLUMNS.items():
+        # every statement of the block is committed on its own
+        with op.get_context().autocommit_block():
+            for column in columns:
+                op.add_column(table, sa.Column(f'{column}_{suffix}', column_type, nullable=True))
+            copy_in_batches(table, ', '.join(
+                f'{column}_{suffix} = {column}::{type_name}' for column in columns))
+
+        # back in the migration transaction, the swap is short
+        op.execute(f'LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE')
+        op.execute(f'UPDATE {table} SET ' + ', '.join(
+            f'{column}_{suffix} = {column}::{type_name}' for column in columns) + ' WHERE ' + ' OR '.join(
+            f'{column}_{suffix}::text IS DISTINCT FROM {column}::{type_name}::text' for column in columns))
+        for column in columns:
+            op.drop_column(table, column)
+            op.alter_column(table, f'{column}_{suffix}', new_column_name=column)
+
+
+def upgrade():
+    convert(postgresql.JSONB(), 'jsonb', 'jsonb')
+
+
+def downgrade():
+    convert(sa.JSON(), 'json', 'json')
@@ -1,11 +1,18 @@
+import re
+from calendar import day_name
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+
 from pendulum import now
-from sqlalchemy import (Boolean, Column, Date, DateTime, ForeignKey, Integer,
-                        SmallInteger, String, JSON, and_, event, exists, or_)
-from sqlalchemy.orm import backref, relationship
+from sqlalchemy import (BigInteger, Boolean, Column, Date, DateTime, ForeignKey, Index, Integer,
+                        SmallInteger, String, Time, and_, event, exists, or_)
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.orm import backref, defer, deferred, make_transient_to_detached, relationship
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 
-from application import db
-from helpers import BaseModel, crypto_password
+from application import db, request_scopes
+from helpers import BaseModel, IntervalIndex, TTLCache, content_digest, crypto_password
+from settings import constants
 
 
 class UserBaseModel(BaseModel):
@@ -58,14 +65,42 @@ class UserProfileModel(db.Model, UserBaseModel):
 
     @classmethod
     def get_user(cls, from_user_id: str):
-        """ Get user by telegram from_user {id: *}
+        """ Get user by telegram from_user {id: *},
+            loaded once per update
         """
+        return request_scopes.identity(
+            ('user_profile', f'{from_user_id}'), lambda: cls._load_user(f'{from_user_id}'))
+
+    @classmethod
+    def _load_user(cls, from_user_id: str):
+        snapshot = profiles_cache.get(from_user_id)
+        if snapshot is not None:
+            # attach the cached columns to the session without a query
+            user = cls.__mapper__.class_manager.new_instance()
+            for name, value in snapshot.items(): setattr(user, name, value)
+            make_transient_to_detached(user)
+            return db.session.merge(user, load=False)
         try:
-            return cls.query.filter(
+            user = cls.query.filter(
                 cls.from_user_id == from_user_id 
             ).one_or_none()
         except (MultipleResultsFound, NoResultFound):
             return
+        if user is not None:
+            profiles_cache.put(from_user_id, {
+                column.key: getattr(user, column.key) for column in cls.__mapper__.column_attrs})
+        return user
+
+    def save(self):
+        super(UserProfileModel, self).save()
+        profiles_cache.pop(self.from_user_id)
+        request_scopes.remember(('user_profile', self.from_user_id), self)
+
+    def delete(self):
+        super(UserProfileModel, self).delete()
+        profiles_cache.pop(self.from_user_id)
+        lessons_indexes.pop(self.from_user_id)
+        request_scopes.remember(('user_profile', self.from_user_id), None)
     
     def set_password(self, password, salt):
         self.password = crypto_password(password, salt, encode=True) \
@@ -73,14 +108,10 @@ class UserProfileModel(db.Model, UserBaseModel):
 
     @classmethod
     def get_password(cls, from_user_id):
-        try:
-            loaded_user = cls.query.filter(
-                cls.from_user_id == from_user_id 
-            ).one_or_none()
-            return crypto_password(
-                loaded_user.password, loaded_user.from_user_id, decode=True)
-        except (MultipleResultsFound, NoResultFound):
-            return
+        loaded_user = cls.get_user(from_user_id)
+        if loaded_user is None: return
+        return crypto_password(
+            loaded_user.password, loaded_user.from_user_id, decode=True)
     
     def update_profile(self, **kwargs):
         for name, value in kwargs.items():
@@ -94,7 +125,8 @@ class UserScheduleModel(db.Model, UserBaseModel):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id  = Column(Integer, ForeignKey('user_profile.id', ondelete='CASCADE'), unique=True)
-    schedule = Column(JSON, nullable=True)
+    schedule = Column(JSONB, nullable=True)
+    schedule_digest = Column(String(64), nullable=True)
     
     last_update_datetime = Column(DateTime(), nullable=False)
 
@@ -104,21 +136,232 @@ class UserScheduleModel(db.Model, UserBaseModel):
         # Mandatory Fields
         self.user_id  = kwargs.get('user_id')
         self.schedule = kwargs.get('schedule')
+        self.schedule_digest = content_digest(self.schedule) if self.schedule else None
 
         # Automatic Fields
         self.last_update_datetime = now().to_datetime_string()
 
     @classmethod
-    def get_schedule_for_user(cls, user_id: int):
-        """ Get schedule for telegram user
+    def get_schedule_for_user(cls, user_id: int, refresh=False):
+        """ Get schedule for telegram user, loaded once per update,
+            refresh - load again and overwrite the loaded instance
+        """
+        def load():
+            try:
+                query = cls.query.populate_existing() if refresh else cls.query
+                return query.filter(
+                    cls.user_id == user_id 
+                ).one_or_none()
+            except (MultipleResultsFound, NoResultFound):
+                return
+        return request_scopes.identity(('user_schedule', int(user_id)), load, refresh)
+
+    ScheduleDay = namedtuple('ScheduleDay', 'lessons schedule_digest last_update_datetime')
+
+    @classmethod
+    def get_schedule_day(cls, user_id: int, day: str):
+        """ Lessons of one day from the lesson rows with the schedule
+            digest and last update, only the schedules saved before the
+            rows are projected by the database (schedule->'Monday')
+        """
+        schedule = db.session.query(
+            cls.schedule_digest, cls.last_update_datetime
+        ).filter(
+            cls.user_id == user_id
+        ).one_or_none()
+        if schedule is None: return
+
+        lessons = [lesson.template_fields for lesson in
+                   UserLessonModel.get_weekday_lessons(user_id, list(day_name).index(day))]
+        if not lessons and not UserLessonModel.has_lessons(user_id):
+            lessons = db.session.query(cls.schedule[day]).filter(cls.user_id == user_id).scalar()
+        return cls.ScheduleDay(lessons, schedule.schedule_digest, schedule.last_update_datetime)
+
+    @classmethod
+    def get_expiring_schedules(cls, expire_before, after_user_id=0, limit=100):
+        """ Get schedules refreshed before expire_before, ordered
+            by user and starting after after_user_id
         """
+        return cls.query.options(defer(cls.schedule)).filter(
+            cls.last_update_datetime < expire_before,
+            cls.user_id > after_user_id
+        ).order_by(cls.user_id).limit(limit).all()
+
+    def update_schedule(self, schedule) -> bool:
+        """ Set the scraped schedule, the lesson rows are rewritten only
+            when the digest differs, freshness is refreshed anyway. The week
+            JSON is not kept, the rows hold the lessons. Returns whether
+            the schedule changed
+        """
+        digest = content_digest(schedule)
+        changed = digest != self.schedule_digest
+        if changed or not UserLessonModel.has_lessons(self.user_id):
+            UserLessonModel.replace_lessons(self.user_id, schedule)
+            self.schedule = None
+            self.schedule_digest = digest
+        self.last_update_datetime = now().to_datetime_string()
+        return changed
+
+
+class UserLessonModel(db.Model, UserBaseModel):
+    """ The User lesson model, one row per lesson of the scraped
+        schedule, indexed for the day views and the lessons index
+    """
+    __tablename__ = 'user_lesson'
+    __table_args__ = (
+        Index('ix_user_lesson_user_id_starts_at', 'user_id', 'starts_at'),
+        Index('ix_user_lesson_user_id_weekday', 'user_id', 'weekday'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey('user_profile.id', ondelete='CASCADE'), nullable=False)
+
+    lesson_date = Column(Date(), nullable=True)
+    weekday = Column(SmallInteger, nullable=False)
+    lesson_number = Column(SmallInteger, nullable=True)
+    start_time = Column(Time(), nullable=True)
+    finish_time = Column(Time(), nullable=True)
+    starts_at = Column(DateTime(), nullable=True)
+    finishes_at = Column(DateTime(), nullable=True)
+
+    subject = Column(String(255), nullable=True)
+    title = Column(String(255), nullable=True)
+    room = Column(String(128), nullable=True)
+    teacher = Column(String(255), nullable=True)
+
+    _date = re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{4})')
+    _time = re.compile(r'(\d{1,2}):(\d{2})')
+
+    @classmethod
+    def parse_date(cls, value):
+        matched = cls._date.search(f'{value or str()}')
+        if not matched: return
+        day, month, year = map(int, matched.groups())
         try:
-            return cls.query.filter(
-                cls.user_id == user_id 
-            ).one_or_none()
-        except (MultipleResultsFound, NoResultFound):
+            return date(year, month, day)
+        except ValueError:
             return
 
+    @classmethod
+    def parse_time(cls, value):
+        matched = cls._time.search(f'{value or str()}')
+        if not matched: return
+        hour, minute = map(int, matched.groups())
+        return time(hour, minute) if hour < 24 and minute < 60 else None
+
+    @classmethod
+    def rows_from_schedule(cls, user_id, schedule) -> list:
+        """ Lesson rows of the scraped schedule {'Monday': [lesson, ...]}
+        """
+        rows = []
+        for weekday, day in enumerate(day_name):
+            for lesson in schedule.get(day) or ():
+                lesson_date = cls.parse_date(lesson.get('lesson_date'))
+                start_time = cls.parse_time(lesson.get('time_start'))
+                finish_time = cls.parse_time(lesson.get('time_finish'))
+                number = f"{lesson.get('lesson_number') or str()}".strip()
+                rows.append({
+                    'user_id':       user_id,
+                    'lesson_date':   lesson_date,
+                    'weekday':       weekday,
+                    'lesson_number': int(number) if number.isdigit() else None,
+                    'start_time':    start_time,
+                    'finish_time':   finish_time,
+                    'starts_at':     datetime.combine(lesson_date, start_time) \
+                        if lesson_date and start_time else None,
+                    'finishes_at':   datetime.combine(lesson_date, finish_time) \
+                        if lesson_date and finish_time else None,
+                    'subject':       lesson.get('lesson_subject'),
+                    'title':         lesson.get('lesson_title'),
+                    'room':          lesson.get('lesson_class'),
+                    'teacher':       lesson.get('lesson_teach'),
+                })
+        return rows
+
+    @classmethod
+    def replace_lessons(cls, user_id, schedule):
+        """ Swap the lessons of the user in the current transaction,
+            committed with the schedule record
+        """
+        cls.query.filter(cls.user_id == user_id).delete(synchronize_session=False)
+        rows = cls.rows_from_schedule(user_id, schedule)
+        if rows: db.session.execute(cls.__table__.insert(), rows)
+
+    @classmethod
+    def has_lessons(cls, user_id) -> bool:
+        return db.session.query(exists().where(cls.user_id == user_id)).scalar()
+
+    @classmethod
+    def get_weekday_lessons(cls, user_id, weekday):
+        return cls.query.filter(
+            cls.user_id == user_id, cls.weekday == weekday
+        ).order_by(cls.starts_at, cls.lesson_number).all()
+
+    @classmethod
+    def get_lessons_index(cls, from_user_id: str):
+        """ Interval index of the user lessons, built from the lesson
+            rows on a miss and kept while the schedule is fresh
+        """
+        lessons_index = lessons_indexes.get(f'{from_user_id}')
+        if lessons_index is not None: return lessons_index
+
+        user_profile = UserProfileModel.get_user(from_user_id)
+        if user_profile is None: return
+        last_update = db.session.query(UserScheduleModel.last_update_datetime).filter(
+            UserScheduleModel.user_id == user_profile.id
+        ).scalar()
+        if last_update is None: return
+
+        lessons = cls.query.filter(
+            cls.user_id == user_profile.id, cls.starts_at.isnot(None), cls.finishes_at.isnot(None)
+        ).all()
+        return cls.index_lessons(from_user_id, [
+            (lesson.starts_at, lesson.finishes_at, lesson.template_fields) for lesson in lessons
+        ], last_update)
+
+    @classmethod
+    def index_lessons(cls, from_user_id: str, intervals, updated_at=None):
+        """ Build and keep the index of (starts_at, finishes_at, fields),
+            until the schedule saved at updated_at goes stale
+        """
+        lessons_index = IntervalIndex(intervals)
+        expires_at = (updated_at or datetime.now()) + \
+            timedelta(days=constants.SCHEDULE_ACTUAL_DAYS + 1)
+        lessons_indexes.put(f'{from_user_id}', lessons_index, ttl=min(
+            (expires_at - datetime.now()).total_seconds(), constants.LESSONS_INDEX_TTL))
+        return lessons_index
+
+    @classmethod
+    def intervals_from_rows(cls, rows) -> list:
+        """ Intervals of the rows_from_schedule lessons with known times
+        """
+        return [
+            (row['starts_at'], row['finishes_at'], cls.fields_of(row)) for row in rows \
+            if row['starts_at'] and row['finishes_at']
+        ]
+
+    @staticmethod
+    def fields_of(row) -> dict:
+        """ Fields of the lesson row for the schedule templates
+        """
+        return {
+            'lesson_date':    row['lesson_date'].strftime('%d.%m.%Y') if row['lesson_date'] else None,
+            'lesson_number':  row['lesson_number'],
+            'time_start':     row['start_time'].strftime('%H:%M') if row['start_time'] else None,
+            'time_finish':    row['finish_time'].strftime('%H:%M') if row['finish_time'] else None,
+            'lesson_subject': row['subject'],
+            'lesson_title':   row['title'],
+            'lesson_class':   row['room'],
+            'lesson_teach':   row['teacher'],
+        }
+
+    @property
+    def template_fields(self) -> dict:
+        """ Fields of the lesson for the schedule templates
+        """
+        return self.fields_of({
+            column.key: getattr(self, column.key) for column in self.__mapper__.column_attrs})
+
 
 class UserRatingModel(db.Model, UserBaseModel):
     """ The User rating model
@@ -130,8 +373,16 @@ class UserRatingModel(db.Model, UserBaseModel):
     
     choosed_year = Column(Integer, nullable=True)
     choosed_semester = Column(Integer, nullable=True)
-    rating = Column(JSON, nullable=True)
-    module = Column(JSON, nullable=True)
+    # loaded on access only, the page flips need the digests
+    rating = deferred(Column(JSONB, nullable=True))
+    module = deferred(Column(JSONB, nullable=True))
+    rating_digest = Column(String(64), nullable=True)
+    module_digest = Column(String(64), nullable=True)
+
+    # year and semester the rating and module were scraped for
+    results_year = Column(Integer, nullable=True)
+    results_semester = Column(Integer, nullable=True)
+    results_update_datetime = Column(DateTime(), nullable=True)
 
     last_update_datetime = Column(DateTime(), nullable=False)
 
@@ -145,20 +396,68 @@ class UserRatingModel(db.Model, UserBaseModel):
         self.choosed_semester = kwargs.get('choosed_semester')
         self.rating = kwargs.get('rating')
         self.module = kwargs.get('module')
+        self.rating_digest = content_digest(self.rating) if self.rating else None
+        self.module_digest = content_digest(self.module) if self.module else None
 
         # Automatic Fields
         self.last_update_datetime = now().to_datetime_string()
 
     @classmethod
-    def get_results_for_user(cls, user_id: int):
-        """ Get academic results for telegram user
+    def get_results_for_user(cls, user_id: int, refresh=False):
+        """ Get academic results for telegram user, loaded once per
+            update, refresh - overwrite the already loaded instance
         """
-        try:
-            return cls.query.filter(
-                cls.user_id == user_id 
-            ).one_or_none()
-        except (MultipleResultsFound, NoResultFound):
-            return
+        def load():
+            try:
+                query = cls.query.populate_existing() if refresh else cls.query
+                return query.filter(
+                    cls.user_id == user_id 
+                ).one_or_none()
+            except (MultipleResultsFound, NoResultFound):
+                return
+        return request_scopes.identity(('user_rating', int(user_id)), load, refresh)
+
+    @classmethod
+    def get_rating_lesson(cls, user_id: int, lesson_number: int):
+        """ One lesson of the rating projected by the database, lessons are
+            numbered from 1 in order (rating->(n-1)->'n'), with the digest
+            and the period scraped
+        """
+        return db.session.query(
+            cls.rating[lesson_number - 1][f'{lesson_number}'].label('lesson'), cls.rating_digest,
+            cls.results_year, cls.results_semester
+        ).filter(
+            cls.user_id == user_id
+        ).one_or_none()
+
+    def update_results(self, rating=None, module=None) -> bool:
+        """ Set the scraped rating and/or module, a JSON column is
+            rewritten only when its digest differs, freshness is
+            refreshed anyway. Returns whether anything changed
+        """
+        changed = False
+        for name, results in (('rating', rating), ('module', module)):
+            if results is None: continue
+            digest = content_digest(results)
+            if digest != getattr(self, f'{name}_digest'):
+                setattr(self, name, results)
+                setattr(self, f'{name}_digest', digest)
+                changed = True
+        self.last_update_datetime = now().to_datetime_string()
+        return changed
+
+    def is_actual(self, year=None, semester=None) -> bool:
+        """ Rating and module were scraped for the year and semester
+            (the chosen ones by default) not long ago
+        """
+        if not self.results_update_datetime: return False
+        year = self.choosed_year if year is None else year
+        semester = self.choosed_semester if semester is None else semester
+        if (self.results_year, self.results_semester) != (year, semester): return False
+
+        from datetime import datetime, timedelta
+        return datetime.now() - self.results_update_datetime < \
+            timedelta(minutes=constants.RESULTS_ACTUAL_MINUTES)
 
 
 class UserPaymentModel(db.Model, UserBaseModel):
@@ -191,4 +490,101 @@ class UserPaymentModel(db.Model, UserBaseModel):
                 cls.user_from_id == user_from_id 
             ).one_or_none()
         except (MultipleResultsFound, NoResultFound):
-            return
\ No newline at end of file
+            return
+
+class RefreshProgressModel(db.Model, UserBaseModel):
+    """ Progress of a background refresh run
+    """
+    __tablename__ = 'refresh_progress'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(64), unique=True, nullable=False)
+    last_user_id = Column(Integer, nullable=False, default=0)
+    refreshed_count = Column(Integer, nullable=False, default=0)
+
+    started_datetime = Column(DateTime(), nullable=True)
+    finished_datetime = Column(DateTime(), nullable=True)
+    last_update_datetime = Column(DateTime(), nullable=False)
+
+    def __init__(self, **kwargs):
+        """ Creates a new refresh progress record.
+        """
+        # Mandatory Fields
+        self.name = kwargs.get('name')
+
+        # Optional Fields
+        self.last_user_id = kwargs.get('last_user_id', 0)
+        self.refreshed_count = kwargs.get('refreshed_count', 0)
+
+        # Automatic Fields
+        self.last_update_datetime = now().to_datetime_string()
+
+    @classmethod
+    def get_progress(cls, name: str):
+        """ Get refresh progress by the refresher name
+        """
+        try:
+            return cls.query.filter(
+                cls.name == name
+            ).one_or_none()
+        except (MultipleResultsFound, NoResultFound):
+            return
+
+    @property
+    def interrupted(self) -> bool:
+        return bool(self.started_datetime) and not self.finished_datetime
+
+    def begin(self):
+        self.last_user_id = 0
+        self.refreshed_count = 0
+        self.started_datetime = now().to_datetime_string()
+        self.finished_datetime = None
+        self.last_update_datetime = now().to_datetime_string()
+
+    def advance(self, user_id, refreshed=True):
+        self.last_user_id = user_id
+        self.refreshed_count += int(refreshed)
+        self.last_update_datetime = now().to_datetime_string()
+
+    def finish(self):
+        self.finished_datetime = now().to_datetime_string()
+        self.last_update_datetime = now().to_datetime_string()
+
+
+
+class ProcessedUpdateModel(db.Model, UserBaseModel):
+    """ Telegram updates taken by any of the bot processes
+    """
+    __tablename__ = 'processed_update'
+
+    update_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    received_datetime = Column(DateTime(), nullable=False, index=True)
+
+    @classmethod
+    def mark(cls, update_id) -> bool:
+        """ Mark the update as taken, False when it already was
+        """
+        statement = insert(cls.__table__).values(
+            update_id=update_id, received_datetime=now().to_datetime_string()
+        ).on_conflict_do_nothing().returning(cls.__table__.c.update_id)
+        marked = db.session.execute(statement).first() is not None
+        db.session.commit()
+        return marked
+
+    @classmethod
+    def forget(cls, update_id):
+        cls.query.filter(cls.update_id == update_id).delete()
+        db.session.commit()
+
+    @classmethod
+    def purge(cls, window):
+        """ Delete the updates older than window seconds
+        """
+        cls.query.filter(
+            cls.received_datetime < now().subtract(seconds=window).to_datetime_string()
+        ).delete()
+        db.session.commit()
+
+
+profiles_cache = TTLCache(ttl=constants.PROFILES_CACHE_TTL, limit=constants.PROFILES_CACHE_LIMIT)
+lessons_indexes = TTLCache(ttl=constants.LESSONS_INDEX_TTL, limit=constants.LESSONS_INDEX_LIMIT)
@@ -1,52 +1,45 @@
 import inspect
 from calendar import day_name
-from re import findall, finditer, search
+from re import finditer, search
 
 import telebot
-from numpy import array_split
 
-from application import phantom_thread_pool, server, telegram
+from application import phantom_thread_pool, request_scopes, scrape_flights, telegram
 from languages.language import languages_challenge
 from menus import menus_challenge
+from routers import CallbackCodec, callback_router
+from screens import static_screens
+from templates import message_templates, pages_indexes, rendered_views
 from settings import constants, logger
 
 
 # handle command '/start'
 @telegram.message_handler(commands=['start'])
+@request_scopes.wrap
 def handle_command_start(message):
-    lang_storage = languages_challenge(message.from_user.language_code)      
+    screen = static_screens(message.from_user.language_code).greeting
     
-    show_message = lang_storage['messages'].get('message_greeting') % \
-        {'name': message.from_user.first_name}
-
-    cb_functions   = ('handle_button_self_add', 'handle_button_self_no')
-    inline_buttons =\
-        menus_challenge(telegram).create_yes_no_menu(lang_storage, cb_data=cb_functions)
+    show_message = screen.text % {'name': message.from_user.first_name}
     telegram.send_message(chat_id=message.from_user.id,
                           text=f"{show_message}",
-                          reply_markup=inline_buttons,
+                          reply_markup=screen.reply_markup,
                           parse_mode='html')
 
 
 # handle selectable 'Yes'
-@telegram.callback_query_handler(
-    func=lambda cb_function: 'button_self_add' in cb_function.data)
+@callback_router.route('handle_button_self_add')
 def handle_button_self_add(cb_function):
-    server.app_context().push()
     lang_storage = languages_challenge(cb_function.from_user.language_code)
      
     from ..models.profiles import UserProfileModel
     user_profile = UserProfileModel.get_user(from_user_id=f'{cb_function.from_user.id}')
     if user_profile:
-        show_message   = lang_storage['messages'].get('message_user_exists') 
-        inline_buttons =\
-            menus_challenge(telegram).create_backward_menu(lang_storage,
-                                                           cb_data=str('handle_button_main_menu'))       
-        telegram.edit_message_text(text=f'{show_message}',
+        screen = static_screens(cb_function.from_user.language_code).user_exists
+        telegram.edit_message_text(text=screen.text,
                                    chat_id=cb_function.from_user.id,
                                    message_id=cb_function.message.message_id,
                                    parse_mode='html',
-                                   reply_markup=inline_buttons)
+                                   reply_markup=screen.reply_markup)
         return
     else:
         show_message = lang_storage['messages'].get('message_login') 
@@ -66,89 +59,60 @@ def handle_button_self_add(cb_function):
 
 
 # handle selectable 'No'
-@telegram.callback_query_handler(
-    func=lambda cb_function: 'button_self_no' in cb_function.data)
+@callback_router.route('handle_button_self_no')
 def handle_button_self_no(cb_function):
     handle_button_main_menu(cb_function)
 
 
-@telegram.callback_query_handler(
-    func=lambda cb_function: 'button_main_menu' in cb_function.data)
+@callback_router.route('handle_button_main_menu')
 def handle_button_main_menu(cb_function):
-    lang_storage = languages_challenge(cb_function.from_user.language_code)    
-
-    show_message = (f"{lang_storage['messages'].get('message_welcome')}"    
-                    f"\n"
-                    f"{lang_storage['messages'].get('message_select_menu')}")
-    inline_buttons = menus_challenge(telegram).create_main_menu(lang_storage)   
+    screen = static_screens(cb_function.from_user.language_code).main_menu
     telegram.edit_message_text(
-                    text=f'{show_message}',
+                    text=screen.text,
                     chat_id=cb_function.from_user.id,
                     message_id=cb_function.message.message_id,
                     parse_mode='html',
-                    reply_markup=inline_buttons)
+                    reply_markup=screen.reply_markup)
 
 
-@telegram.callback_query_handler(
-    func=lambda cb_function: 'button_updates' in cb_function.data)
+@callback_router.route('handle_button_updates')
 def handle_button_updates(cb_function):
-    lang_storage = languages_challenge(cb_function.from_user.language_code)     
-    
-    show_message = lang_storage['messages'].get('message_updates')    
-    inline_buttons =\
-        menus_challenge(telegram).create_backward_menu(lang_storage,
-                                                       cb_data=str('handle_button_main_menu'))
-    telegram.edit_message_text(text=f'{show_message}',
+    screen = static_screens(cb_function.from_user.language_code).updates
+    telegram.edit_message_text(text=screen.text,
                                chat_id=cb_function.from_user.id,
                                message_id=cb_function.message.message_id,
                                parse_mode='html',
-                               reply_markup=inline_buttons)  
+                               reply_markup=screen.reply_markup)
 
 
-@telegram.callback_query_handler(
-    func=lambda cb_function: 'button_feedback' in cb_function.data)
+@callback_router.route('handle_button_feedback')
 def handle_button_feedback(cb_function):
-    lang_storage = languages_challenge(cb_function.from_user.language_code)
-
-    show_message = lang_storage['messages'].get('message_feedback')    
-    inline_buttons =\
-        menus_challenge(telegram).create_backward_menu(lang_storage,
-                                                       cb_data=str('handle_button_main_menu'))
-    telegram.edit_message_text(text=f'{show_message}',
+    screen = static_screens(cb_function.from_user.language_code).feedback
+    telegram.edit_message_text(text=screen.text,
                                chat_id=cb_function.from_user.id,
                                message_id=cb_function.message.message_id,
                                parse_mode='html',
-                               reply_markup=inline_buttons)    
+                               reply_markup=screen.reply_markup)
 
 
-@telegram.callback_query_handler(
-    func=lambda cb_function: 'button_settings' in cb_function.data)
+@callback_router.route('handle_button_settings')
 def handle_button_settings(cb_function):
-    lang_storage = languages_challenge(cb_function.from_user.language_code)
-    
-    show_message = lang_storage['messages'].get('message_settings')    
-    cb_functions = ('handle_button_self_add',
-                    'handle_button_self_delete', 
-                    'handle_button_main_menu')
-    inline_buttons =\
-        menus_challenge(telegram).create_settings_menu(lang_storage,
-                                                       cb_data=cb_functions)
-    telegram.edit_message_text(text=f'{show_message}',
+    screen = static_screens(cb_function.from_user.language_code).settings
+    telegram.edit_message_text(text=screen.text,
                                chat_id=cb_function.from_user.id,
                                message_id=cb_function.message.message_id,
                                parse_mode='html',
-                               reply_markup=inline_buttons)  
+                               reply_markup=screen.reply_markup)  
 
 
-@telegram.callback_query_handler(
-    func=lambda cb_function: 'button_self_delete' in cb_function.data)
+@callback_router.route('handle_button_self_delete')
 def handle_button_self_delete(cb_function):
-    server.app_context().push()
     lang_storage = languages_challenge(cb_function.from_user.language_code)
     
     from ..models.profiles import UserProfileModel
     user_profile = UserProfileModel.get_user(from_user_id=f'{cb_function.from_user.id}')
     if user_profile: user_profile.delete()
+    rendered_views.forget(cb_function.from_user.id)
     
     show_message = lang_storage['messages'].get('message_completed') 
     telegram.answer_callback_query(cb_function.id,
@@ -156,59 +120,72 @@ def handle_button_self_delete(cb_function):
                                    text=f'{show_message}')
 
 
-@telegram.callback_query_handler(
-    func=lambda cb_function: 'button_student_schedule' in cb_function.data)
+@callback_router.route('handle_button_student_schedule')
 def handle_button_student_schedule(cb_function):  
-    server.app_context().push()
-    lang_storage = languages_challenge(cb_function.from_user.language_code)
-
-    show_message = lang_storage['messages'].get('message_day_of_week')
-    inline_buttons =\
-        menus_challenge(telegram).create_days_of_week_menu(lang_storage,
-                                                           cb_data=tuple(day_name))
-    telegram.edit_message_text(text=f'{show_message}',
+    screen = static_screens(cb_function.from_user.language_code).days_of_week
+    telegram.edit_message_text(text=screen.text,
                                chat_id=cb_function.from_user.id,
                                message_id=cb_function.message.message_id,
                                parse_mode='html',
-                               reply_markup=inline_buttons)
+                               reply_markup=screen.reply_markup)
 
 
-@telegram.callback_query_handler(
-    func=lambda cb_function: cb_function.data in tuple(day_name))
+@callback_router.route('handle_button_days_of_week', *day_name)
 def handle_button_days_of_week(cb_function):
     lang_storage = languages_challenge(cb_function.from_user.language_code)
+
+    # 'handle_button_days_of_week:Monday' or the legacy 'Monday'
+    *_, day = cb_function.data.split(':')
+    view = ('schedule', day)
+    rendered = rendered_views.get(cb_function.from_user.id, view, cb_function.from_user.language_code)
+    if rendered: show_rendered(cb_function, rendered); return
     
     try:
-        all_schedule = extract_schedule(cb_function)
-        assert(all_schedule)
-        
-        specific_schedule = all_schedule.get(cb_function.data)
-        assert(specific_schedule)        
+        assert(day in day_name)
+        schedule_day = extract_schedule(cb_function, day)
+        assert(schedule_day and schedule_day.lessons)
     except (AssertionError, Exception) as error:
         exception_message_error(cb_function, lang_storage, error); return 
 
-    def lesson_specifically(lesson) -> list:
-        tab = '\t'; return [
-            f"<b>{4*tab}{lesson.get('lesson_date')}</b>" % {
-                'lesson_date': lang_storage['messages'].get('message_lesson_date')},
-            f"{lesson.get('lesson_title')}" % {
-                'lesson_title': lang_storage['messages'].get('message_lesson_title')},            
-            f"{lesson.get('lesson_subject')}" % {
-                'lesson_subject': lang_storage['messages'].get('message_lesson_subject')}, 
-            f"{4*tab}{lesson.get('lesson_enumerate')}" % {
-                'lesson_enumerate': lang_storage['messages'].get('message_lesson_enumerate'),
-                'time_first':       lang_storage['messages'].get('message_lesson_from'),
-                'time_second':      lang_storage['messages'].get('message_lesson_to')},
-            f"{lesson.get('lesson_text')}" % {
-                'lesson_class': f"{8*tab}{lang_storage['messages'].get('message_lesson_class')}",
-                'lesson_teach': f"{8*tab}{lang_storage['messages'].get('message_lesson_teach')}"}        
-        ]
-
-    show_message = f"{lang_storage['messages'].get('message_lesson_caption')}"
-    for lesson in schedule_day: show_message += ''.join(lesson_specifically(lesson))
+    show_message = message_templates(cb_function.from_user.language_code).schedule(schedule_day.lessons)
     inline_buttons =\
         menus_challenge(telegram).create_backward_menu(lang_storage,
                                                        cb_data=str('handle_button_student_schedule'))
+    # shown until the schedule is stale and scraped again
+    rendered = rendered_views.put(cb_function.from_user.id, view, cb_function.from_user.language_code,
+                                  schedule_day.schedule_digest, f'{show_message}', inline_buttons.to_json(),
+                                  expires_after(schedule_day.last_update_datetime,
+                                                days=constants.SCHEDULE_ACTUAL_DAYS + 1))
+    show_rendered(cb_function, rendered)
+
+
+# handle commands '/now', '/next' and '/today'
+@telegram.message_handler(commands=['now', 'next', 'today'])
+@request_scopes.wrap
+def handle_command_lessons(message):
+    # '/next' or '/next@rah_rah_nmu_bot'
+    kind = message.text.split()[0].lstrip('/').split('@')[0]
+    show_message, inline_buttons = lessons_message(message.from_user, kind,
+                                                   cb_data=str('handle_button_main_menu'))
+    telegram.send_message(chat_id=message.from_user.id,
+                          text=f'{show_message}',
+                          reply_markup=inline_buttons,
+                          parse_mode='html')
+
+
+@callback_router.route('handle_button_lessons')
+def handle_button_lessons(cb_function):
+    lang_storage = languages_challenge(cb_function.from_user.language_code)
+
+    # 'handle_button_lessons:now', 'handle_button_lessons:next' or 'handle_button_lessons:today'
+    *_, kind = cb_function.data.split(':')
+    try:
+        assert(kind in lessons_lookups)
+        show_message, inline_buttons = lessons_message(cb_function.from_user, kind,
+                                                       cb_data=str('handle_button_student_schedule'))
+    except (AssertionError, Exception) as error:
+        exception_message_error(cb_function, lang_storage, error); return
+
     telegram.edit_message_text(text=f'{show_message}',
                                chat_id=cb_function.from_user.id,
                                message_id=cb_function.message.message_id,
@@ -216,10 +193,40 @@ def handle_button_days_of_week(cb_function):
                                reply_markup=inline_buttons)
 
 
-@telegram.callback_query_handler(
-    func=lambda cb_function: 'button_student_rating' in cb_function.data)
+def lessons_today(lessons_index, moment):
+    from datetime import datetime, time, timedelta
+    today = datetime.combine(moment.date(), time())
+    return lessons_index.between(today, today + timedelta(days=1))
+
+
+lessons_lookups = {
+    'now':   lambda lessons_index, moment: list(filter(None, [lessons_index.current(moment)])),
+    'next':  lambda lessons_index, moment: list(filter(None, [lessons_index.following(moment)])),
+    'today': lessons_today,
+}
+
+
+def lessons_message(from_user, kind, cb_data=str()):
+    """ The lessons of the kind looked up in the interval index of
+        the user, the database is hit only to build a missing index
+    """
+    from datetime import datetime
+    from pytz import timezone
+    from ..models.profiles import UserLessonModel
+
+    lang_storage = languages_challenge(from_user.language_code)
+    lessons_index = UserLessonModel.get_lessons_index(from_user.id)
+    # the lessons are naive times of the university, whatever the host clock is
+    moment = datetime.now(timezone(constants.ACS_TIMEZONE)).replace(tzinfo=None)
+    lessons = lessons_lookups[kind](lessons_index, moment) if lessons_index else []
+
+    show_message = message_templates(from_user.language_code).lessons(kind, lessons)
+    inline_buttons = menus_challenge(telegram).create_backward_menu(lang_storage, cb_data=cb_data)
+    return show_message, inline_buttons.to_json()
+
+
+@callback_router.route('handle_button_student_rating')
 def handle_button_student_rating(cb_function):
-    server.app_context().push()
     lang_storage = languages_challenge(cb_function.from_user.language_code)    
    
     from pendulum import now
@@ -248,37 +255,26 @@ def handle_button_student_rating(cb_function):
                                reply_markup=inline_buttons)
 
 
-@telegram.callback_query_handler(
-    func=lambda cb_function: cb_function.data in available_year(cb_function))
+@callback_router.route('handle_button_year', numeric=True)
 def handle_button_year(cb_function):
-    server.app_context().push()
     lang_storage = languages_challenge(cb_function.from_user.language_code)    
 
-    cb_functions = (item for item in constants.SEMESTERS.keys())
-    inline_buttons =\
-        menus_challenge(telegram).create_semester_menu(lang_storage, cb_data=cb_functions)
-
     try:
-        from ..models.profiles import UserProfileModel
-        user_profile = UserProfileModel.get_user(from_user_id=f'{cb_function.from_user.id}')
-        assert(user_profile)
-        
-        from ..models.profiles import UserRatingModel
-        user_rating = UserRatingModel.get_results_for_user(user_profile.id) or \
-            UserRatingModel(**{
-                'user_id':      user_profile.id,
-                'choosed_year': int(cb_function.data)}
-            )
-        assert(user_rating)
-        user_rating.choosed_year = int(cb_function.data)
-
-        from pendulum import now
-        user_rating.last_update_datetime = now().to_datetime_string()
-        
-        user_rating.save()
+        # the year is carried further in callback_data, nothing is saved
+        # until the rating or module is requested, 'handle_button_year:y2017',
+        # the untagged 'handle_button_year:2017' or the legacy '2017'
+        *_, argument = cb_function.data.split(':')
+        year = int(argument) if argument.isdigit() else \
+            CallbackCodec.decode(cb_function.data).year
+        assert(year)
     except (AssertionError, Exception) as error:
         exception_message_error(cb_function, lang_storage, error); return 
 
+    cb_functions = (CallbackCodec.encode('handle_button_semester', year=year, semester=item)
+                    for item in constants.SEMESTERS.values())
+    inline_buttons =\
+        menus_challenge(telegram).create_semester_menu(lang_storage, cb_data=cb_functions)
+
     show_message = lang_storage['messages'].get('message_semester')
     telegram.edit_message_text(text=f'{show_message}',
                                chat_id=cb_function.from_user.id,
@@ -287,39 +283,23 @@ def handle_button_year(cb_function):
                                reply_markup=inline_buttons)
 
 
-@telegram.callback_query_handler(
-    func=lambda cb_function: cb_function.data in 
-    (item for item in constants.SEMESTERS.keys()))
+@callback_router.route('handle_button_semester', *constants.SEMESTERS.keys())
 def handle_button_semester(cb_function):
-    server.app_context().push()
     lang_storage = languages_challenge(cb_function.from_user.language_code)
 
-    cb_functions = ('handle_button_academic_rating',
-                    'handle_button_academic_module')
-    inline_buttons =\
-        menus_challenge(telegram).create_rating_module_menu(lang_storage, cb_data=cb_functions)
-
     try:
-        from ..models.profiles import UserProfileModel
-        user_profile = UserProfileModel.get_user(from_user_id=f'{cb_function.from_user.id}')
-        assert(user_profile)
-        
-        from ..models.profiles import UserRatingModel
-        user_rating = UserRatingModel.get_results_for_user(user_profile.id) or \
-            UserRatingModel(**{
-                'user_id': user_profile.id,
-                'choosed_semester': constants.SEMESTERS.get(cb_function.data)}
-            )
-        assert(user_rating)
-        user_rating.choosed_semester = constants.SEMESTERS.get(cb_function.data)
-
-        from pendulum import now
-        user_rating.last_update_datetime = now().to_datetime_string()
-        
-        user_rating.save()
+        # 'Autumn' - legacy button without the year, the saved one is used
+        fields = CallbackCodec.decode(cb_function.data)
+        semester = constants.SEMESTERS.get(cb_function.data, fields.semester)
+        assert(semester in constants.SEMESTERS.values())
     except (AssertionError, Exception) as error:
         exception_message_error(cb_function, lang_storage, error); return 
 
+    cb_functions = (CallbackCodec.encode(item, year=fields.year, semester=semester)
+                    for item in ('handle_button_academic_rating', 'handle_button_academic_module'))
+    inline_buttons =\
+        menus_challenge(telegram).create_rating_module_menu(lang_storage, cb_data=cb_functions)
+
     show_message = lang_storage['messages'].get('message_rating_or_module')
     telegram.edit_message_text(text=f'{show_message}',
                                chat_id=cb_function.from_user.id,
@@ -328,233 +308,169 @@ def handle_button_semester(cb_function):
                                reply_markup=inline_buttons)
 
 
-@telegram.callback_query_handler(
-    func=\
-    lambda cb_function: 'button_academic_rating' in cb_function.data)
+@callback_router.route('handle_button_academic_rating')
 def handle_button_academic_rating(cb_function):
     lang_storage = languages_challenge(cb_function.from_user.language_code)
+    fields = CallbackCodec.decode(cb_function.data)
+
+    view = ('rating', 'academic', fields.year, fields.semester)
+    rendered = rendered_views.get(cb_function.from_user.id, view, cb_function.from_user.language_code)
+    if rendered: show_rendered(cb_function, rendered); return
     
     try:
-        rating = extract_rating(cb_function)
-        assert(rating)
-
-        # if rating information is extract, then split lessons to the pages
-        pages_count = round(len(rating) / constants.PAGES_COUNT) or 1
-        pages_imaginary = array_split(rating, pages_count)
+        user_rating = extract_rating(cb_function, fields.year, fields.semester)
+        assert(user_rating)
     except (AssertionError, Exception) as error:
         exception_message_error(cb_function, lang_storage, error); return 
 
-    show_message = f"{lang_storage['messages'].get('message_rating_caption')}"
-    pages_enumerate = []; start_page, *_ = pages_imaginary
-    for lesson in pages_imaginary[pages_imaginary.index(start_page)]: 
-        pages_enumerate.append(int(*lesson))
-        *_, last_lesson = pages_enumerate        
-        
-        lesson_caption = lesson.get(f"{last_lesson}").get('lesson_caption').strip()      
-        show_message  += ''.join(f"<b>{last_lesson}\u002e</b>\u0020{lesson_caption}\n\n")
-
-    start_lesson, finish_lesson = min(pages_enumerate), max(pages_enumerate)
-    
-    cb_functions   = (str('page_rating:{page}'), str('lesson_rating:{page}:{lesson}'))
-    inline_buttons =\
-        menus_challenge(telegram).create_pagination_rating(lang_storage, 1, pages_count, start_lesson,
-                                                           finish_lesson, cb_data=cb_functions)
-    telegram.edit_message_text(text=f'{show_message}',
-                               chat_id=cb_function.from_user.id,
-                               message_id=cb_function.message.message_id,
-                               parse_mode='html',
-                               reply_markup=inline_buttons)
+    # shown until the results are stale and scraped again
+    show_rating_page(cb_function, lang_storage, user_rating, 1, fields, view,
+                     expires_after(user_rating.results_update_datetime,
+                                   minutes=constants.RESULTS_ACTUAL_MINUTES))
 
 
-@telegram.callback_query_handler(
-    func=lambda cb_function: 'page_rating' in cb_function.data)
+@callback_router.route('page_rating')
 def handle_button_page_rating(cb_function):
-    server.app_context().push()
     lang_storage = languages_challenge(cb_function.from_user.language_code)
+    fields = CallbackCodec.decode(cb_function.data)
+
+    view = ('rating', 'page', fields.year, fields.semester, fields.page)
+    rendered = rendered_views.get(cb_function.from_user.id, view, cb_function.from_user.language_code)
+    if rendered: show_rendered(cb_function, rendered); return
 
     try:
-        from ..models.profiles import UserProfileModel
-        user_profile = UserProfileModel.get_user(from_user_id=f'{cb_function.from_user.id}')
-        assert(user_profile)
-        
-        from ..models.profiles import UserRatingModel
-        user_rating = UserRatingModel.get_results_for_user(user_id=f'{user_profile.id}')
+        user_rating = stored_results(cb_function, 'rating', fields)
         assert(user_rating)
-
-        # if rating information is extract, then split lessons to the pages
-        pages_count = round(len(user_rating.rating) / constants.PAGES_COUNT) or 1
-        pages_imaginary = array_split(user_rating.rating, pages_count)
     except (AssertionError, Exception) as error:
         exception_message_error(cb_function, lang_storage, error); return  
 
-    page = findall(r'\d+', cb_function.data).pop()
+    show_rating_page(cb_function, lang_storage, user_rating, int(fields.page), fields, view)
 
-    show_message = f"{lang_storage['messages'].get('message_rating_caption')}"
-    pages_enumerate = []
-    for lesson in pages_imaginary[int(page) - 1]: 
-        pages_enumerate.append(int(*lesson))
-        *_, last_lesson = pages_enumerate        
-        
-        lesson_caption = lesson.get(f"{last_lesson}").get('lesson_caption').strip()      
-        show_message  += ''.join(f"<b>{last_lesson}\u002e</b>\u0020{lesson_caption}\n\n")
-    
-    start_lesson, finish_lesson = min(pages_enumerate), max(pages_enumerate)
 
-    cb_functions   = (str('page_rating:{page}'), str('lesson_rating:{page}:{lesson}'))
-    inline_buttons =\
-        menus_challenge(telegram).create_pagination_rating(lang_storage, int(page), pages_count,
-                                                           start_lesson, finish_lesson, cb_data=cb_functions)
-    telegram.edit_message_text(text=f'{show_message}',
-                               chat_id=cb_function.from_user.id,
-                               message_id=cb_function.message.message_id,
-                               parse_mode='html',
-                               reply_markup=inline_buttons)
-
-
-@telegram.callback_query_handler(
-    func=lambda cb_function: 'lesson_rating' in cb_function.data)
+@callback_router.route('lesson_rating')
 def handle_button_lesson_rating(cb_function):
-    server.app_context().push()
     lang_storage = languages_challenge(cb_function.from_user.language_code)
+    fields = CallbackCodec.decode(cb_function.data)
+
+    view = ('rating', 'lesson', fields.year, fields.semester, fields.lesson)
+    rendered = rendered_views.get(cb_function.from_user.id, view, cb_function.from_user.language_code)
+    if rendered: show_rendered(cb_function, rendered); return
 
     try:
         from ..models.profiles import UserProfileModel
         user_profile = UserProfileModel.get_user(from_user_id=f'{cb_function.from_user.id}')
-        assert(user_profile)
-        
+        assert(user_profile and fields.lesson)
+
         from ..models.profiles import UserRatingModel
-        user_rating = UserRatingModel.get_results_for_user(user_id=f'{user_profile.id}')
-        assert(user_rating)
+        rating_lesson = UserRatingModel.get_rating_lesson(user_profile.id, fields.lesson)
+        if rating_lesson and not period_of(rating_lesson, fields):
+            assert(extract_rating(cb_function, fields.year, fields.semester))
+            rating_lesson = UserRatingModel.get_rating_lesson(user_profile.id, fields.lesson)
+        assert(rating_lesson and rating_lesson.lesson and period_of(rating_lesson, fields))
     except (AssertionError, Exception) as error:
         exception_message_error(cb_function, lang_storage, error); return  
 
-    def lesson_specifically(lesson) -> list:
-        empty_data = lang_storage['messages'].get('message_empty_data')
-        tab = '\t'; lesson_sequence = str()
-        if lesson.get('lesson_enumerate'):
-            for item in lesson.get('lesson_enumerate'):
-                lesson_title    = item.get('lesson_title')    or empty_data
-                lesson_presence = item.get('lesson_presence') or empty_data
-                lesson_rating   = item.get('lesson_rating')   or empty_data
-
-                lesson_sequence += (
-                    f"{4*tab}<b>%(lesson_title)s</b>{lesson_title}\n"
-                    f"{8*tab}<b>%(lesson_presence_rating)s{lesson_presence}</b>\u002C\u0020{lesson_rating}\n\n" 
-                ) % {
-                    'lesson_title': lang_storage['messages'].get('message_rating_title'),              
-                    'lesson_presence_rating': lang_storage['messages'].get('message_rating_presence_rating')
-                }    
-        else:
-            lesson_sequence += f"{4*tab}<b>{empty_data}</b>"
-
-        return ''.join([f"<b>{lesson.get('lesson_caption').strip()}</b>", '\n\n', lesson_sequence])
-
-    page, lesson_number, *_ = findall(r'\d+', cb_function.data)
-    
-    for lesson in user_rating.rating: 
-        if str(lesson_number) in lesson:
-            show_message = lesson_specifically(lesson.get(str(lesson_number))); break
+    show_message = message_templates(
+        cb_function.from_user.language_code).rating_lesson(rating_lesson.lesson)
     inline_buttons =\
         menus_challenge(telegram).create_backward_menu(lang_storage,
-                                                       cb_data=str('page_rating:{page}').format(page=page))
-    telegram.edit_message_text(text=f'{show_message}',
-                               chat_id=cb_function.from_user.id,
-                               message_id=cb_function.message.message_id,
-                               parse_mode='html',
-                               reply_markup=inline_buttons)
+                                                       cb_data=CallbackCodec.replace(
+            cb_function.data, 'page_rating', lesson=None))
+    rendered = rendered_views.put(cb_function.from_user.id, view, cb_function.from_user.language_code,
+                                  rating_lesson.rating_digest, f'{show_message}', inline_buttons.to_json())
+    show_rendered(cb_function, rendered)
 
 
-@telegram.callback_query_handler(
-    func=\
-    lambda cb_function: 'button_academic_module' in cb_function.data)
+@callback_router.route('handle_button_academic_module')
 def handle_button_academic_module(cb_function):
     lang_storage = languages_challenge(cb_function.from_user.language_code)
+    fields = CallbackCodec.decode(cb_function.data)
+
+    view = ('module', 'academic', fields.year, fields.semester)
+    rendered = rendered_views.get(cb_function.from_user.id, view, cb_function.from_user.language_code)
+    if rendered: show_rendered(cb_function, rendered); return
     
     try:
-        module = extract_module(cb_function)
-        assert(module)
-
-        # if module information is extract, then split lessons to the pages
-        pages_count = round(len(module) / constants.PAGES_COUNT) or 1
-        pages_imaginary = array_split(module, pages_count)
+        user_module = extract_module(cb_function, fields.year, fields.semester)
+        assert(user_module)
     except (AssertionError, Exception) as error:
         exception_message_error(cb_function, lang_storage, error); return   
 
-    def lesson_specifically(lesson) -> list:
-        empty_data = lang_storage['messages'].get('message_empty_data')
-        tab = '\t'; return [
-            f"<b>\u00b7\u0020{lesson.get('lesson_title')}</b>\n",
-            f"{4*tab}%(module_first)s - <b>{lesson.get('module_first')   or empty_data}</b>\n"   % {
-                'module_first': lang_storage['messages'].get('message_module_first')},
-            f"{4*tab}%(module_second)s - <b>{lesson.get('module_second') or empty_data}</b>\n\n" % {
-                'module_second': lang_storage['messages'].get('message_module_second')},      
-        ]
-
-    show_message   = f"{lang_storage['messages'].get('message_module_caption')}"
-    inline_buttons = menus_challenge(telegram).create_pagination_module(lang_storage, 1, pages_count,
-                                                                        cb_data=str('page_module:{page}'))
-    start_page, *_ = pages_imaginary
-    for lesson in pages_imaginary[pages_imaginary.index(start_page)]: 
-        show_message += ''.join(lesson_specifically(lesson))
-    telegram.edit_message_text(text=f'{show_message}',
-                               chat_id=cb_function.from_user.id,
-                               message_id=cb_function.message.message_id,
-                               parse_mode='html',
-                               reply_markup=inline_buttons)
+    show_module_page(cb_function, lang_storage, user_module, 1, fields, view,
+                     expires_after(user_module.results_update_datetime,
+                                   minutes=constants.RESULTS_ACTUAL_MINUTES))
 
 
-@telegram.callback_query_handler(
-    func=lambda cb_function: 'page_module' in cb_function.data)
+@callback_router.route('page_module')
 def handle_button_page_module(cb_function):
-    server.app_context().push()
     lang_storage = languages_challenge(cb_function.from_user.language_code)
+    fields = CallbackCodec.decode(cb_function.data)
 
+    view = ('module', 'page', fields.year, fields.semester, fields.page)
     try:
-        from ..models.profiles import UserProfileModel
-        user_profile = UserProfileModel.get_user(from_user_id=f'{cb_function.from_user.id}')
-        assert(user_profile)
-        
-        from ..models.profiles import UserRatingModel
-        user_module = UserRatingModel.get_results_for_user(user_id=f'{user_profile.id}')
-        assert(user_module)
+        rendered = rendered_views.get(cb_function.from_user.id, view, cb_function.from_user.language_code)
+        if rendered: show_rendered(cb_function, rendered); return
+    except telebot.apihelper.ApiException as error:
+        logger.error(f'{error}'); return
 
-        # if module information is extract, then split lessons to the pages
-        pages_count = round(len(user_module.module) / constants.PAGES_COUNT) or 1
-        pages_imaginary = array_split(user_module.module, pages_count)
+    try:
+        user_module = stored_results(cb_function, 'module', fields)
+        assert(user_module)
     except (AssertionError, Exception) as error:
         exception_message_error(cb_function, lang_storage, error); return    
 
-    def lesson_specifically(lesson) -> list:
-        empty_data = lang_storage['messages'].get('message_empty_data')
-        tab = '\t'; return [
-            f"<b>\u00b7\u0020{lesson.get('lesson_title')}</b>\n",
-            f"{4*tab}%(module_first)s - <b>{lesson.get('module_first')   or empty_data}</b>\n"   % {
-                'module_first': lang_storage['messages'].get('message_module_first')},
-            f"{4*tab}%(module_second)s - <b>{lesson.get('module_second') or empty_data}</b>\n\n" % {
-                'module_second': lang_storage['messages'].get('message_module_second')},      
-        ]
-
-    page = findall(r'\d+', cb_function.data).pop()
-
-    show_message = f"{lang_storage['messages'].get('message_module_caption')}"
-    inline_buttons = menus_challenge(telegram).create_pagination_module(lang_storage, int(page), pages_count,
-                                                                        cb_data=str('page_module:{page}'))
-    for lesson in pages_imaginary[int(page) - 1]:
-        show_message += ''.join(lesson_specifically(lesson))
     try:
-        telegram.edit_message_text(text=f'{show_message}',
-                                   chat_id=cb_function.from_user.id,
-                                   message_id=cb_function.message.message_id,
-                                   parse_mode='html',
-                                   reply_markup=inline_buttons)
+        show_module_page(cb_function, lang_storage, user_module, int(fields.page), fields, view)
     except telebot.apihelper.ApiException as error:
         logger.error(f'{error}')
 
 
+def show_rating_page(cb_function, lang_storage, user_rating, page, fields, view, expires_at=None):
+    rating_pages = results_pages(user_rating, 'rating')
+    show_message = rating_pages.text(page, message_templates(cb_function.from_user.language_code))
+    start_lesson, finish_lesson = rating_pages.lessons_range(page)
+
+    inline_buttons =\
+        menus_challenge(telegram).create_pagination_rating(lang_storage, page, rating_pages.count,
+                                                           start_lesson, finish_lesson,
+                                                           cb_data=rating_pagination(fields))
+    rendered = rendered_views.put(cb_function.from_user.id, view, cb_function.from_user.language_code,
+                                  user_rating.rating_digest, f'{show_message}', inline_buttons.to_json(),
+                                  expires_at)
+    show_rendered(cb_function, rendered)
+
+
+def show_module_page(cb_function, lang_storage, user_module, page, fields, view, expires_at=None):
+    module_pages = results_pages(user_module, 'module')
+    show_message = module_pages.text(page, message_templates(cb_function.from_user.language_code))
+    inline_buttons =\
+        menus_challenge(telegram).create_pagination_module(lang_storage, page, module_pages.count,
+                                                           cb_data=module_pagination(fields))
+    rendered = rendered_views.put(cb_function.from_user.id, view, cb_function.from_user.language_code,
+                                  user_module.module_digest, f'{show_message}', inline_buttons.to_json(),
+                                  expires_at)
+    show_rendered(cb_function, rendered)
+
+
+def show_rendered(cb_function, rendered):
+    telegram.edit_message_text(text=rendered.text,
+                               chat_id=cb_function.from_user.id,
+                               message_id=cb_function.message.message_id,
+                               parse_mode='html',
+                               reply_markup=rendered.reply_markup)
+
+
+def expires_after(moment, **kwargs):
+    """ The moment the data saved at moment stops being fresh
+    """
+    from datetime import datetime, timedelta
+    return moment + timedelta(**kwargs) if isinstance(moment, datetime) else None
+
+
 @telegram.message_handler(
-    func=lambda message: True, content_types=['text']) 
+    func=lambda message: True, content_types=['text'])
+@request_scopes.wrap
 def sign_up_login(message):   
-    server.app_context().push()
     lang_storage = languages_challenge(message.from_user.language_code) 
   
     from ..models.profiles import UserProfileModel
@@ -574,8 +490,8 @@ def sign_up_login(message):
 
 @telegram.message_handler(
     func=lambda message: True, content_types=['text'])
+@request_scopes.wrap
 def sign_up_password(message):
-    server.app_context().push()
     lang_storage = languages_challenge(message.from_user.language_code) 
   
     from ..models.profiles import UserProfileModel
@@ -595,8 +511,8 @@ def sign_up_password(message):
 
 @telegram.message_handler(
     func=lambda message: True, content_types=['text'])
+@request_scopes.wrap
 def sign_up_learning(message):
-    server.app_context().push()
     lang_storage = languages_challenge(message.from_user.language_code) 
 
     from ..models.profiles import UserProfileModel
@@ -615,30 +531,35 @@ def sign_up_learning(message):
                           reply_markup=inline_buttons)
 
 
-def available_year(cb_function):
-    from ..models.profiles import UserProfileModel
-    user_profile = UserProfileModel.get_user(from_user_id=f'{cb_function.from_user.id}')
-    if not user_profile: return []
-    
+def available_year(user_profile):
     from pendulum import now 
     date_start = int(user_profile.learning_start_date)
     return [str(item) for item in range(date_start, now().year + 1)]
 
 
-def extractor(user_profile, parser_engine) -> bool:          
-    try:
+def extractor(user_profile, parser_engine, **period) -> bool:          
+    def extractor_engine():
         kwargs = user_profile.to_dict()
         kwargs.update({
             'password': user_profile.get_password(user_profile.from_user_id)}
         )
-        phantom_thread_pool.add_goal(parser_engine, **kwargs)
-        phantom_thread_pool.wait_completion()
+        # the goal scrapes the requested period, not the one saved last
+        kwargs.update(period)
+        request_scopes.release()
+        # wait for this goal only, not for the whole queue
+        return phantom_thread_pool.add_goal(parser_engine, **kwargs).result(
+            timeout=constants.PHANTOMJS_GOAL_TIMEOUT)
+
+    try:
+        # the same scrape requested while one is running waits for it
+        scrape_flights.do(
+            (user_profile.id, parser_engine.__name__, *period.values()), extractor_engine)
     except:
         return False    
     return True
 
 
-def extract_schedule(cb_function):
+def extract_schedule(cb_function, day):
     lang_storage = languages_challenge(cb_function.from_user.language_code)    
 
     user_profile = user_profile_suitable(cb_function.from_user.id)
@@ -655,105 +576,144 @@ def extract_schedule(cb_function):
 
         return extractor(user_profile, acs_parser.parse_schedule)
     
+    # only the day is loaded, with the schedule update time
     from ..models.profiles import UserScheduleModel
-    user_schedule = UserScheduleModel.get_schedule_for_user(user_profile.id)
-    if user_schedule:
+    schedule_day = UserScheduleModel.get_schedule_day(user_profile.id, day)
+    if schedule_day:
         # check the relevance
         from pendulum import parse, now
-        dt_last_update = user_schedule.last_update_datetime.isoformat()
+        dt_last_update = schedule_day.last_update_datetime.isoformat()
         
         dt_schedule = parse(dt_last_update, exact=True)
         schedule_days_diff = dt_schedule.diff(now()).in_days()
-        if schedule_days_diff > constants.SCHEDULE_ACTUAL_DAYS:
-            # make a request to the asc, parse and save
-            # and return/show result
-            if extract_schedule_engine(user_profile):
-                user_schedule = UserScheduleModel.get_schedule_for_user(user_profile.id)
-                return user_schedule.schedule if user_schedule else str()
-            return str()
-        else:
-            return user_schedule.schedule or str()           
-    else:    
-        # make a request to the asc, parse and save into parser
-        # and return/show result
-        if extract_schedule_engine(user_profile):
-            user_schedule = UserScheduleModel.get_schedule_for_user(user_profile.id)
-            return user_schedule.schedule if user_schedule else str()
-        return str()
-       
-    return str()
-
-
-def extract_rating(cb_function):
+        if schedule_days_diff <= constants.SCHEDULE_ACTUAL_DAYS:
+            return schedule_day
+
+    # make a request to the asc, parse and save
+    # and return/show result
+    if extract_schedule_engine(user_profile):
+        return UserScheduleModel.get_schedule_day(user_profile.id, day)
+    return
+
+
+def extract_results(cb_function, wait_message, year=None, semester=None):
     lang_storage = languages_challenge(cb_function.from_user.language_code)    
 
     user_profile = user_profile_suitable(cb_function.from_user.id)
     if not user_profile: return
+    if year is not None and f'{year}' not in available_year(user_profile): return
+
+    from ..models.profiles import UserRatingModel
+    user_results = UserRatingModel.get_results_for_user(user_profile.id)
+    if user_results and user_results.is_actual(year, semester):
+        # rating and module of one page load are fresh, reuse them
+        return user_results
+
+    # the menus do not save the selection, it is saved before the scrape
+    user_results = user_results or UserRatingModel(user_id=user_profile.id)
+    if year is not None: user_results.choosed_year = year
+    if semester is not None: user_results.choosed_semester = semester
+
+    from pendulum import now
+    user_results.last_update_datetime = now().to_datetime_string()
+    user_results.save()
 
-    def extract_rating_engine(user_profile) -> bool:
+    def extract_results_engine(user_profile) -> bool:
         from parsers import acs_parser
         
-        show_message = lang_storage['messages'].get('message_wait_rating')
+        show_message = lang_storage['messages'].get(wait_message)
         telegram.edit_message_text(text=f'{show_message}',
                                    chat_id=cb_function.from_user.id,
                                    message_id=cb_function.message.message_id,
                                    parse_mode='html')
         
-        return extractor(user_profile, acs_parser.parse_rating)
+        return extractor(user_profile, acs_parser.parse_results,
+                         year=user_results.choosed_year, semester=user_results.choosed_semester)
 
-    if extract_rating_engine(user_profile):
-        from ..models.profiles import UserRatingModel
+    if extract_results_engine(user_profile):
+        user_results = UserRatingModel.get_results_for_user(user_profile.id, refresh=True)
+        # a scrape of another period may have saved after this one
+        return user_results if user_results and \
+            (user_results.results_year, user_results.results_semester) == \
+            (user_results.choosed_year if year is None else year,
+             user_results.choosed_semester if semester is None else semester) else None
 
-        user_rating = UserRatingModel.get_results_for_user(user_profile.id)
-        return user_rating.rating if user_rating else str()
+    return
 
-    return str()
 
+def extract_rating(cb_function, year=None, semester=None):
+    user_rating = extract_results(cb_function, 'message_wait_rating', year, semester)
+    return user_rating if results_pages(user_rating, 'rating') else None
 
-def extract_module(cb_function):
-    lang_storage = languages_challenge(cb_function.from_user.language_code)    
 
-    user_profile = user_profile_suitable(cb_function.from_user.id)
+def extract_module(cb_function, year=None, semester=None):
+    user_module = extract_results(cb_function, 'message_wait_module', year, semester)
+    return user_module if results_pages(user_module, 'module') else None
+
+
+def results_pages(user_results, kind):
+    """ Pages index of the rating or module, built once per content,
+        the deferred JSON column is loaded only to build a missing index
+    """
+    if not user_results: return
+    return pages_indexes.get(kind, getattr(user_results, f'{kind}_digest'),
+                             lambda: getattr(user_results, kind))
+
+
+def stored_results(cb_function, kind, fields):
+    """ Results stored for the period of the page, scraped again
+        when the stored ones are of another period
+    """
+    from ..models.profiles import UserProfileModel
+    user_profile = UserProfileModel.get_user(from_user_id=f'{cb_function.from_user.id}')
     if not user_profile: return
 
-    def extract_module_engine(user_profile) -> bool:
-        from parsers import acs_parser
-        
-        show_message = lang_storage['messages'].get('message_wait_module')
-        telegram.edit_message_text(text=f'{show_message}',
-                                   chat_id=cb_function.from_user.id,
-                                   message_id=cb_function.message.message_id,
-                                   parse_mode='html')
-        
-        return extractor(user_profile, acs_parser.parse_module)
-    
-    if extract_module_engine(user_profile):
-        from ..models.profiles import UserRatingModel
+    from ..models.profiles import UserRatingModel
+    user_results = UserRatingModel.get_results_for_user(user_id=f'{user_profile.id}')
+    if user_results and not period_of(user_results, fields):
+        user_results = extract_results(cb_function, f'message_wait_{kind}', fields.year, fields.semester)
+    return user_results if results_pages(user_results, kind) else None
+
+
+def period_of(user_results, fields) -> bool:
+    """ Results are of the period of the callback_data, the old
+        buttons without one take any
+    """
+    return fields.year is None or \
+        (user_results.results_year, user_results.results_semester) == (fields.year, fields.semester)
 
-        user_module = UserRatingModel.get_results_for_user(user_profile.id)
-        return user_module.module if user_module else str()
 
-    return str()
+def rating_pagination(fields):
+    period = f"{CallbackCodec.encode('', year=fields.year, semester=fields.semester)}"
+    return (f'page_rating{period}:p{{page}}', f'lesson_rating{period}:p{{page}}:l{{lesson}}')
+
+
+def module_pagination(fields):
+    period = f"{CallbackCodec.encode('', year=fields.year, semester=fields.semester)}"
+    return f'page_module{period}:p{{page}}'
 
 
 def exception_message_error(cb_function, lang_storage, error=str()):
     logger.exception(f"{error}")
 
-    show_message   = lang_storage['messages'].get('message_oops')
-    inline_buttons =\
-        menus_challenge(telegram).create_backward_menu(lang_storage,
-                                                       cb_data=str('handle_button_main_menu'))        
-    telegram.edit_message_text(text=f'{show_message}',
+    screen = static_screens(cb_function.from_user.language_code).oops
+    telegram.edit_message_text(text=screen.text,
                                chat_id=cb_function.from_user.id,
                                message_id=cb_function.message.message_id,
                                parse_mode='html',
-                               reply_markup=inline_buttons)
+                               reply_markup=screen.reply_markup)
 
 
 def user_profile_suitable(user_id):
-    server.app_context().push()
 
     from ..models.profiles import UserProfileModel 
     user_profile = UserProfileModel.get_user(f'{user_id}')
     return user_profile \
         if user_profile and user_profile.username and user_profile.password else None
+
+
+# the only callback query handler, callback_router picks the view
+@telegram.callback_query_handler(func=lambda cb_function: True)
+@request_scopes.wrap
+def handle_callback_query(cb_function):
+    callback_router(cb_function)
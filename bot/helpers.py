@@ -1,8 +1,15 @@
 import base64
+import hashlib
 import inspect
 import json
 import os
+import signal
 import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
 from functools import wraps
 from queue import Empty, Queue
 from threading import Thread
@@ -128,14 +135,139 @@ class BaseModel(object):
         }
 
 
+class RequestScopes(object):
+    """ Application context and database session of one handler
+        call or pool goal: the context is pushed, the session is
+        committed (rolled back on error), removed and the context popped.
+        Nested scopes of the same thread join the outer one
+    """
+    def __init__(self, app, db):
+        self.app = app
+        self.db = db
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(('opened', 'closed', 'rollbacks', 'leaked'), 0)
+
+    def count(self, name):
+        with self.lock: self.counters[name] += 1
+
+    @contextmanager
+    def __call__(self):
+        depth = getattr(self.local, 'depth', 0)
+        if depth:
+            self.local.depth += 1
+            try:
+                yield self.db.session
+            finally:
+                self.local.depth -= 1
+            return
+
+        from flask import _app_ctx_stack
+        context = self.app.app_context()
+        context.push()
+        self.local.depth = 1
+        self.local.identities = {}
+        self.count('opened')
+        try:
+            yield self.db.session
+            self.db.session.commit()
+        except:
+            self.db.session.rollback()
+            self.count('rollbacks')
+            raise
+        finally:
+            self.local.depth = 0
+            self.local.identities = None
+            self.db.session.remove()
+            # contexts pushed inside the scope and never popped
+            while _app_ctx_stack.top is not None and _app_ctx_stack.top is not context:
+                _app_ctx_stack.top.pop()
+                self.count('leaked')
+            context.pop()
+            self.count('closed')
+
+    def identity(self, key, load, refresh=False):
+        """ Object of the key loaded once per scope (identity map),
+            every call loads it outside of a scope
+        """
+        identities = getattr(self.local, 'identities', None)
+        if identities is None: return load()
+        if refresh or key not in identities: identities[key] = load()
+        return identities[key]
+
+    def remember(self, key, value):
+        identities = getattr(self.local, 'identities', None)
+        if identities is not None: identities[key] = value
+
+    def release(self):
+        """ End the transaction of the scope before a long wait, so
+            the connection is not left idle in transaction, the next
+            query opens a new one
+        """
+        if getattr(self.local, 'depth', 0): self.db.session.commit()
+
+    def wrap(self, func):
+        """ Run func inside its own scope (decorator)
+        """
+        @wraps(func)
+        def scoped(*args, **kwargs):
+            with self(): return func(*args, **kwargs)
+        return scoped
+
+    @property
+    def stats(self) -> dict:
+        with self.lock: stats = dict(self.counters)
+        stats['active'] = stats['opened'] - stats['closed']
+        return stats
+
+
+@contextmanager
+def no_scope():
+    yield
+
+
+class TTLCache(object):
+    """ Bounded LRU of values that expire ttl seconds after
+        they are put, ttl 0 disables the cache
+    """
+    def __init__(self, ttl, limit):
+        self.ttl = ttl
+        self.limit = limit
+        self.values = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        if self.ttl <= 0: return
+        with self.lock:
+            expires_at, value = self.values.get(key, (0, None))
+            if expires_at <= time.monotonic():
+                self.values.pop(key, None); return
+            self.values.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl=None):
+        """ ttl - seconds for this value instead of the cache ttl
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0: return
+        with self.lock:
+            self.values[key] = (time.monotonic() + ttl, value)
+            self.values.move_to_end(key)
+            while len(self.values) > self.limit: self.values.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock: self.values.pop(key, None)
+
+
 class PhantomJSExecutor(Thread):
     """ Thread executing tasks/goal from a given tasks/goal queue.
         Thread is signalable, to exit
     """
-    def __init__(self, goals, threads_n):
+    def __init__(self, goals, threads_n, scope=no_scope):
         Thread.__init__(self)
         
         self.goals = goals
+        self.scope = scope
         self.daemon = True
         self.threads_number = threads_n
         self.done = threading.Event()
@@ -145,12 +277,14 @@ class PhantomJSExecutor(Thread):
     def run(self):       
         while not self.done.is_set():
             try:
-                func, args, kwargs = self.goals.get(
+                func, args, kwargs, future = self.goals.get(
                     block=True, timeout=constants.PHANTOMJS_QUEUE_TIMEOUT)
                 try:
-                    func(*args, **kwargs)
+                    if future.set_running_or_notify_cancel():
+                        with self.scope(): result = func(*args, **kwargs)
+                        future.set_result(result)
                 except Exception as error:
-                    logger.exception(f'{error}')
+                    future.set_exception(error)
                 finally:
                     self.goals.task_done()
             except Empty: pass
@@ -162,17 +296,137 @@ class PhantomJSExecutor(Thread):
         self.done.set()
 
 
+class PhantomJSDriverPool(object):
+    """ Pool of warm PhantomJS drivers leased to the goals.
+        A driver is health-checked and cleaned after every goal, it is
+        recycled after uses_limit goals or above rss_limit bytes, and
+        the keeper thread spawns replacements in the background
+    """
+    def __init__(self, factory, drivers_n, uses_limit, rss_limit):
+        self.factory = factory
+        self.uses_limit = uses_limit
+        self.rss_limit = rss_limit
+        self.uses = {}
+        self.idle = Queue()
+        self.spawns = Queue()
+        self.done = threading.Event()
+
+        for item in range(drivers_n): self.spawns.put(item)
+        self.keeper = Thread(target=self._keep, daemon=True)
+        self.keeper.start()
+
+    def _keep(self):
+        """ Spawn a driver for every spawn request, drivers which
+            fail to start are retried after a pause
+        """
+        while not self.done.is_set():
+            try:
+                item = self.spawns.get(
+                    block=True, timeout=constants.PHANTOMJS_QUEUE_TIMEOUT)
+            except Empty: continue
+            try:
+                driver = self.factory()
+            except Exception as error:
+                logger.exception(f'{error}')
+                self.done.wait(constants.PHANTOMJS_RESPAWN_WAIT)
+                self.spawns.put(item)
+            else:
+                self.uses[id(driver)] = 0
+                self.idle.put(driver)
+
+    def _rss(self, driver):
+        """ Resident set size of the driver process in bytes (linux only)
+        """
+        try:
+            with open(f'/proc/{driver.service.process.pid}/status') as status_file:
+                for line in status_file:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, AttributeError): pass
+        return 0
+
+    def _alive(self, driver):
+        try:
+            return driver.service.process.poll() is None and bool(driver.window_handles)
+        except Exception:
+            return False
+
+    def _reset(self, driver):
+        """ Forget everything the previous goal left in the driver
+        """
+        driver.execute_script(
+            'try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}')
+        driver.delete_all_cookies()
+        driver.get('about:blank')
+
+    def _retire(self, driver):
+        """ Kill the driver and ask the keeper for a replacement
+        """
+        self.uses.pop(id(driver), None)
+        try:
+            driver.service.process.send_signal(signal.SIGTERM)
+            driver.quit()
+        except Exception as error:
+            logger.exception(f'{error}')
+        if not self.done.is_set(): self.spawns.put(id(driver))
+
+    def acquire(self, timeout=None):
+        """ Take an idle driver, dead ones are replaced on the way
+        """
+        while True:
+            driver = self.idle.get(block=True, timeout=timeout)
+            if self._alive(driver):
+                return driver
+            self._retire(driver)
+
+    def release(self, driver):
+        """ Return the driver to the pool or recycle it
+        """
+        self.uses[id(driver)] = self.uses.get(id(driver), 0) + 1
+        try:
+            self._reset(driver)
+            healthy = self._alive(driver) and self.uses[id(driver)] < self.uses_limit \
+                and self._rss(driver) < self.rss_limit
+        except Exception:
+            healthy = False
+        # no asserts, python -O would keep every driver forever
+        if not healthy: self._retire(driver); return
+        self.idle.put(driver)
+
+    @contextmanager
+    def lease(self, timeout=None):
+        driver = self.acquire(timeout=timeout)
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def close(self):
+        """ Stop the keeper and quit all idle drivers
+        """
+        self.done.set()
+        while True:
+            try:
+                self._retire(self.idle.get_nowait())
+            except Empty: break
+
+
 class PhantomJSThreadPool(object):
     """ Pool of threads consuming tasks from a queue 
     """
-    def __init__(self, threads_n, goals=[]):
+    def __init__(self, threads_n, goals=[], drivers_factory=None, scope=no_scope):
         self.goals = Queue(threads_n)
         self.executors = []
+        self.scope = scope
         self.done = False
+        self.drivers = None if drivers_factory is None else PhantomJSDriverPool(
+            drivers_factory, constants.PHANTOMJS_DRIVERS_COUNT,
+            uses_limit=constants.PHANTOMJS_DRIVER_USES,
+            rss_limit=constants.PHANTOMJS_DRIVER_RSS_LIMIT)
         
         self._init_executors(threads_n)
         
-        for goal in goals: self.goals.put(goal)
+        for func, args, kwargs in goals: self.add_goal(func, *args, **kwargs)
 
     def __del__(self):
         self._close_all_threads()
@@ -184,15 +438,19 @@ class PhantomJSThreadPool(object):
         for executor in self.executors:
             executor.signal_exit()
         self.executors = []
+        if self.drivers: self.drivers.close()
 
     def _init_executors(self, threads_n):
         for item in range(threads_n): self.executors.append(
-            PhantomJSExecutor(self.goals, item))
+            PhantomJSExecutor(self.goals, item, scope=self.scope))
 
     def add_goal(self, func, *args, **kwargs):
-        """ Add a task to the queue
+        """ Add a task to the queue, returns the future
+            holding the task result or exception
         """
-        self.goals.put((func, args, kwargs))
+        future = Future()
+        self.goals.put((func, args, kwargs, future))
+        return future
 
     def wait_completion(self):
         """ Wait for completion of all the tasks in the queue
@@ -200,6 +458,189 @@ class PhantomJSThreadPool(object):
         self.goals.join()
 
 
+class UpdatesProcessor(object):
+    """ Dispatcher of the webhook updates onto serial lanes. Updates
+        of one chat always land on the same lane and keep their order
+        (next step handlers depend on it), different chats run in parallel.
+        queue_size bounds the queued and running updates of all lanes
+    """
+    def __init__(self, process, lanes_n, queue_size, shard=None):
+        self.process = process
+        self.shard = shard or update_chat_id
+        self.slots = threading.BoundedSemaphore(max(queue_size, 1))
+        self.lanes = [Queue() for _ in range(lanes_n)]
+        self.workers = [
+            Thread(target=self._work, args=(lane, ), daemon=True) for lane in self.lanes
+        ]
+        for worker in self.workers: worker.start()
+
+    def _work(self, lane):
+        while True:
+            update = lane.get(block=True)
+            try:
+                self.process(update)
+            except Exception as error:
+                logger.exception(f'{error}')
+            finally:
+                lane.task_done()
+                self.slots.release()
+
+    def submit(self, update) -> bool:
+        """ Enqueue the update on the lane of its chat,
+            False when all the slots are taken
+        """
+        if not self.slots.acquire(blocking=False):
+            return False
+        self.lanes[self.shard(update) % len(self.lanes)].put_nowait(update)
+        return True
+
+    @property
+    def depths(self):
+        return [lane.qsize() for lane in self.lanes]
+
+    @property
+    def depth(self):
+        return sum(self.depths)
+
+
+class UpdatesDeduplicator(object):
+    """ Bounded, time windowed set of the taken update ids, telegram
+        re-delivers an update when the webhook answers too slowly.
+        backend - optional shared store (see ProcessedUpdateModel)
+        for deployments that run several processes
+    """
+    def __init__(self, window, limit, backend=None, purge_every=1000):
+        self.window = window
+        self.limit = limit
+        self.backend = backend
+        self.purge_every = purge_every
+        self.marks = 0
+        self.updates = OrderedDict()
+        self.lock = threading.Lock()
+
+    def seen(self, update_id) -> bool:
+        """ Mark the update as taken, True when it already was
+        """
+        moment = time.monotonic()
+        with self.lock:
+            while self.updates and \
+                  next(iter(self.updates.values())) < moment - self.window:
+                self.updates.popitem(last=False)
+            if update_id in self.updates:
+                return True
+            self.updates[update_id] = moment
+            while len(self.updates) > self.limit:
+                self.updates.popitem(last=False)
+            self.marks += 1
+            purge = self.marks % self.purge_every == 0
+
+        if self.backend is None:
+            return False
+        try:
+            if purge: self.backend.purge(self.window)
+            return not self.backend.mark(update_id)
+        except Exception:
+            # not taken, the re-delivered update must not look like a duplicate
+            with self.lock:
+                self.updates.pop(update_id, None)
+            raise
+
+    def forget(self, update_id):
+        """ The update was not taken after all (e.g. queue is full)
+        """
+        with self.lock:
+            self.updates.pop(update_id, None)
+        if self.backend is not None: self.backend.forget(update_id)
+
+
+class SingleFlight(object):
+    """ Coalesce concurrent calls sharing a key, the first
+        caller runs the function and the others wait for its result
+    """
+    class Flight(object):
+        __slots__ = ('done', 'result', 'error')
+
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.flights = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """ Run func or wait for the flight already running
+            with the same key, TimeoutError when it takes too long
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader: flight = self.flights[key] = self.Flight()
+
+        if not leader:
+            if not flight.done.wait(self.timeout):
+                raise TimeoutError(f'* Flight {key} is still in progress.')
+            if flight.error is not None: raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func(*args, **kwargs)
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self.lock: self.flights.pop(key, None)
+            flight.done.set()
+        return flight.result
+
+
+class IntervalIndex(object):
+    """ Sorted intervals [start, finish) with their values, the lookups
+        bisect the starts. Intervals are expected not to overlap
+        (the lessons of one student)
+    """
+    def __init__(self, intervals):
+        intervals = sorted(intervals, key=lambda interval: interval[0])
+        self.starts = [start for start, _, _ in intervals]
+        self.finishes = [finish for _, finish, _ in intervals]
+        self.values = [value for _, _, value in intervals]
+
+    def __len__(self):
+        return len(self.values)
+
+    def current(self, moment):
+        """ Value of the interval the moment is in
+        """
+        index = bisect_right(self.starts, moment) - 1
+        return self.values[index] if index >= 0 and self.finishes[index] > moment else None
+
+    def following(self, moment):
+        """ Value of the first interval starting after the moment
+        """
+        index = bisect_right(self.starts, moment)
+        return self.values[index] if index < len(self.values) else None
+
+    def between(self, start, finish) -> list:
+        """ Values of the intervals starting in [start, finish)
+        """
+        return self.values[bisect_left(self.starts, start):bisect_left(self.starts, finish)]
+
+
+def update_chat_id(json_update):
+    """ Chat of the raw telegram update, the update id
+        for updates that do not belong to a chat
+    """
+    for name in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if name in json_update:
+            return int(json_update[name]['chat']['id'])
+    for name in ('callback_query', 'inline_query', 'chosen_inline_result',
+                 'shipping_query', 'pre_checkout_query'):
+        if name in json_update:
+            return int(json_update[name]['from']['id'])
+    return int(json_update.get('update_id', 0))
+
 def json_decode(target_data):
     try:
         request_data = json.loads(target_data.decode("utf-8"))
@@ -208,6 +649,23 @@ def json_decode(target_data):
     else:
         return request_data
 
+def content_digest(target_data):
+    """ Stable digest of json serializable data,
+        equal data gives equal digest regardless of keys order
+    """
+    serialized = json.dumps(target_data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+def split_sections(target_data, sections):
+    """ Split the sequence into sections of almost equal size,
+        the first len % sections get one item more (as numpy.array_split)
+    """
+    size, extra = divmod(len(target_data), sections)
+    bounds = [0]
+    for index in range(sections):
+        bounds.append(bounds[-1] + size + (1 if index < extra else 0))
+    return [target_data[start:finish] for start, finish in zip(bounds, bounds[1:])]
+
 def valid_mandatory_fields(target_data, fields=set()):
     """ Checks for missing/empty fields.
     """
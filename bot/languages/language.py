@@ -1,22 +1,65 @@
 import json
 import inspect
+import os
+import threading
+import time
+from types import MappingProxyType
 
 support_languages = {"en": "en", "ua": "ua", "ru": "ru"} 
 
 
 class LanguagesChallenge(object):
+    """ All languages are loaded once into a read-only catalog,
+        the file is loaded again when its mtime is changed, not
+        more often than once per reload_interval seconds
+    """
 
-    def __init__(self, languages_file, *args, **kwargs):
+    def __init__(self, languages_file, reload_interval=0, *args, **kwargs):
         self.__languages_file = languages_file
+        self.__reload_interval = reload_interval
+        self.__lock = threading.Lock()
+        self.__checked_at = 0
+        self.__mtime = None
+        self.__catalog = MappingProxyType({})
+        self.generation = 0
+
+        self.reload()
 
     def __call__(self, language_code, *args, **kwargs):
         return self.get_language_data(language_code)
 
+    @property
+    def catalog(self):
+        moment = time.monotonic()
+        if moment - self.__checked_at >= self.__reload_interval:
+            self.__checked_at = moment
+            self.reload()
+        return self.__catalog
+
+    def reload(self, force=False) -> bool:
+        """ Swap the catalog if the file is changed, a broken
+            file keeps the previous catalog
+        """
+        with self.__lock:
+            try:
+                mtime = os.stat(self.__languages_file).st_mtime_ns
+                if not force and mtime == self.__mtime: return False
+                with open(self.__languages_file, encoding='utf-8') as language_file:
+                    catalog = json.load(language_file, object_hook=MappingProxyType)
+            except (OSError, ValueError):
+                if not self.__catalog: raise
+                from settings import logger
+                logger.exception(f'* Languages file {self.__languages_file} is not reloaded.')
+                return False
+
+            self.__catalog, self.__mtime = catalog, mtime
+            self.generation += 1
+        return True
+
     def get_language_data(self, language_code): 
         lcode = self._get_language_code(language_code)
-        with open(self.__languages_file, encoding='utf-8') as language_file:  
-            language_data = json.load(language_file)
-        return language_data.get(lcode, support_languages.get("en"))
+        catalog = self.catalog
+        return catalog.get(lcode) or catalog.get(support_languages.get("en"))
 
     def _get_language_code(self, language_code):
         if not language_code:
@@ -29,4 +72,5 @@ class LanguagesChallenge(object):
 
 
 from settings import constants
-languages_challenge = LanguagesChallenge(languages_file=constants.LANGUAGES_FILE)
+languages_challenge = LanguagesChallenge(languages_file=constants.LANGUAGES_FILE,
+                                         reload_interval=constants.LANGUAGES_RELOAD_INTERVAL)
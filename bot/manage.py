@@ -13,6 +13,7 @@ migrate = Migrate(server, db, directory=f'{constants.BASE_DIR}/handlers/models/m
 manager = Manager(server)
 manager.add_command('db', MigrateCommand)
 manager.add_command('loaddata', LoadDataCommand)
+manager.add_command('refresh', RefreshSchedulesCommand)
 
 from handlers.models import (profiles, )
 
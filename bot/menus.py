@@ -1,7 +1,8 @@
-import numpy
 import telebot
 from telebot.types import InlineKeyboardButton
 
+from helpers import split_sections
+from routers import CallbackCodec
 from settings import logger
 
 
@@ -35,6 +36,10 @@ class MenusChallenge(object):
             button.callback_data = f"{day}"
         
         inline_buttons.row(*sequencing_buttons)
+        inline_buttons.row(*[
+            InlineKeyboardButton(f"{lang_storage['buttons'].get(f'button_lessons_{kind}')}",
+                                 callback_data=f'handle_button_lessons:{kind}') for kind in ('now', 'next', 'today')
+        ])
         inline_buttons.row(
             InlineKeyboardButton(f"{lang_storage['buttons'].get('button_backward')}",
                                  callback_data='handle_button_main_menu')
@@ -47,9 +52,9 @@ class MenusChallenge(object):
         
         sequencing_buttons = [
             InlineKeyboardButton(f"{str(item)}/{str(item + 1)}",
-                                 callback_data=str(item)) for item in cb_data
+                                 callback_data=CallbackCodec.encode('handle_button_year', year=item)) for item in cb_data
         ]
-        sorted_seq_buttons = numpy.array_split(sequencing_buttons, 2)
+        sorted_seq_buttons = split_sections(sequencing_buttons, 2)
         for row_buttons in sorted_seq_buttons: inline_buttons.row(*row_buttons)
         inline_buttons.row(
             InlineKeyboardButton(f"{lang_storage['buttons'].get('button_backward')}",
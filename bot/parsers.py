@@ -1,7 +1,14 @@
 import re
 import signal
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urljoin
 
-from bs4 import BeautifulSoup
+from calendar import day_name
+
+from bs4 import BeautifulSoup, SoupStrainer
 from croniter import croniter
 from pendulum import now
 from requests.exceptions import ConnectTimeout, HTTPError, ReadTimeout
@@ -23,29 +30,134 @@ try:
 except ImportError as error:
     raise ImportError(f'Please install selenium: pip install selenium\n{error.msg}')
 
+try:
+    import lxml
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
 
-class ACSParser(object):
-    """ Custom and simple parser for ACS.
+
+class ACSAuthenticationError(Exception):
+    """ ACS did not let the user past the login form.
     """
-    def __call__(self, parser_type):
-        return self.parse(parser_type)
+    pass
+
+
+class ACSSession(object):
+    """ Authenticated ACS session of one user: cookies
+        and the sidebar links resolved after login.
+    """
+    __slots__ = ('cookies', 'links', 'expires_at', 'size')
+
+    def __init__(self, cookies, links, expires_at):
+        self.cookies = cookies
+        self.links = links
+        self.expires_at = expires_at
+        self.size = sum(
+            len(f"{cookie.get('name')}{cookie.get('value')}{cookie.get('domain')}{cookie.get('path')}")
+            for cookie in cookies
+        ) + sum(len(f'{name}{link}') for name, link in links.items())
+
+    @property
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+
+class ACSSessionPool(object):
+    """ Per-user pool of authenticated ACS sessions.
+        Sessions expire after ttl seconds (or earlier when a cookie
+        says so) and the least recently used ones are evicted once
+        the pool grows above memory_limit bytes.
+    """
+    def __init__(self, ttl, memory_limit):
+        self.ttl = ttl
+        self.memory_limit = memory_limit
+        self.memory_usage = 0
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(**kwargs):
+        return (kwargs.get('id'), kwargs.get('username'))
+
+    def get(self, key):
+        """ Get a live session, None if there is no one or it expired
+        """
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                return
+            if session.expired:
+                self._discard(key)
+                return
+            self.sessions.move_to_end(key)
+            return session
+
+    def put(self, key, cookies, links):
+        """ Remember the session cookies after a successful login
+        """
+        expires_at = time.monotonic() + self.ttl
+        for cookie in cookies:
+            if cookie.get('expiry'):
+                expires_at = min(expires_at,
+                                 time.monotonic() + cookie.get('expiry') - time.time())
+        session = ACSSession(cookies, links, expires_at)
+        with self.lock:
+            self._discard(key)
+            self.sessions[key] = session
+            self.memory_usage += session.size
+            while self.memory_usage > self.memory_limit and len(self.sessions) > 1:
+                self._discard(next(iter(self.sessions)))
+        return session
+
+    def invalidate(self, key):
+        with self.lock:
+            self._discard(key)
+
+    def _discard(self, key):
+        session = self.sessions.pop(key, None)
+        if session is not None:
+            self.memory_usage -= session.size
+
+
+def create_phantom_entity():
+    desired_capabilities = dict(DesiredCapabilities.PHANTOMJS)
+    desired_capabilities['phantomjs.page.settings.loadImages'] = False
+    try:
+        phantom = PhantomJS(executable_path=constants.PHANTOMJS_EXEC,
+                            desired_capabilities=desired_capabilities,
+                            service_args=['--ignore-ssl-errors=true'])
+        phantom.implicitly_wait(constants.PHANTOMJS_IMPLICITLY_WAIT)
+        return phantom
+    except WebDriverException as error:
+        raise WebDriverException(
+            f'Please install phantomjs: http://phantomjs.org/\n{error.msg}')
+    return
 
-    def _create_phantom_entity(self):
-        desired_capabilities = dict(DesiredCapabilities.PHANTOMJS)
-        desired_capabilities['phantomjs.page.settings.loadImages'] = False
+
+class ACSPhantomEngine(object):
+    """ Engine that drives a PhantomJS browser through ACS pages.
+    """
+    @contextmanager
+    def _phantom_entity(self):
+        """ Lease a warm driver from the pool, without
+            the pool spawn a browser just for this goal
+        """
+        from application import phantom_thread_pool
+        if phantom_thread_pool.drivers:
+            with phantom_thread_pool.drivers.lease(
+                    timeout=constants.PHANTOMJS_LEASE_TIMEOUT) as phantom:
+                yield phantom
+            return
+
+        phantom = create_phantom_entity()
         try:
-            phantom = PhantomJS(executable_path=constants.PHANTOMJS_EXEC,
-                                desired_capabilities=desired_capabilities,
-                                service_args=['--ignore-ssl-errors=true'])
-            phantom.implicitly_wait(constants.PHANTOMJS_IMPLICITLY_WAIT)
-            return phantom
-        except WebDriverException as error:
-            raise WebDriverException(
-                f'Please install phantomjs: http://phantomjs.org/\n{error.msg}')
-        return
-
-    def _sign_in(self, **kwargs):
-        phantom = self._create_phantom_entity()
+            yield phantom
+        finally:
+            phantom.service.process.send_signal(signal.SIGTERM)
+            phantom.quit()
+
+    def _sign_in(self, phantom, **kwargs):
         phantom.get(f'{constants.ACS_BASE_URL}/site/login')
         
         tag_input_login = phantom.find_element_by_xpath(f"//input[contains(@id, 'username')]")   
@@ -60,6 +172,203 @@ class ACSParser(object):
 
         return phantom
 
+    def _sidebar_links(self, phantom):
+        tag_sidebar = phantom.find_element_by_id('sidebar')
+        return {
+            href_part: tag_sidebar.find_element_by_xpath(
+                f"//a[contains(@href, '{href_part}')]").get_attribute('href')
+            for href_part in ACSParser.sidebar
+        }
+
+    def _open_page(self, phantom, href_part, query=str(), **kwargs):
+        """ Open a sidebar page with the pooled session cookies of the
+            user, sign in again when ACS sends us back to the login form.
+        """
+        key = acs_sessions.key(**kwargs)
+        acs_session = acs_sessions.get(key)
+        if acs_session:
+            # cookies can only be set for the domain of the current page
+            phantom.get(f'{constants.ACS_BASE_URL}/site/login')
+            for cookie in acs_session.cookies:
+                phantom.add_cookie({name: cookie.get(name)
+                                    for name in ('name', 'value', 'domain', 'path')})
+            phantom.get(f'{acs_session.links.get(href_part)}{query}')
+            if '/site/login' not in phantom.current_url:
+                return phantom
+            acs_sessions.invalidate(key)
+            phantom.delete_all_cookies()
+
+        self._sign_in(phantom, **kwargs)
+        links = self._sidebar_links(phantom)
+        phantom.get(f'{links.get(href_part)}{query}')
+        acs_sessions.put(key, phantom.get_cookies(), links)
+
+        return phantom
+
+    def schedule_markup(self, **kwargs):
+        """ Sign in, open 'self/time' and return the inner html
+            of the schedule table.
+        """
+        with self._phantom_entity() as phantom:
+            self._open_page(phantom, 'self/time', **kwargs)
+            tag_table_time = phantom.find_element_by_xpath("//table[contains(@id, 'time')]")
+            return tag_table_time.get_attribute('innerHTML')
+
+    def student_markup(self, tabs, year, semester, **kwargs):
+        """ Sign in, open 'self/student' for the year and semester
+            once and return the inner html of every tab in tabs.
+        """
+        with self._phantom_entity() as phantom:
+            self._open_page(phantom, 'self/student', f'?year={year}&sem={semester}', **kwargs)
+            return {
+                tab: phantom.find_element_by_xpath(
+                    f"//div[contains(@id, 'tab_{tab}')]").get_attribute('innerHTML')
+                for tab in tabs
+            }
+
+
+class ACSHttpEngine(object):
+    """ Browserless engine, submits the login form and follows
+        the sidebar links through plain http requests.
+    """
+    def _create_session(self):
+        session = Session()
+        session.verify = constants.ACS_VERIFY_SSL
+        session.headers.update({'User-Agent': constants.ACS_USER_AGENT})
+        return session
+
+    def _request(self, session, method, url, **kwargs):
+        response = session.request(method, url,
+                                   timeout=constants.ACS_REQUEST_TIMEOUT, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def sign_in(self, session, **kwargs):
+        """ Fill the '/site/login' form (hidden csrf fields included)
+            and post it, return the landing page response.
+        """
+        login_url = f'{constants.ACS_BASE_URL}/site/login'
+        response = self._request(session, 'GET', login_url)
+
+        soup = BeautifulSoup(response.text, 'html.parser')
+        tag_input_login = soup.find('input', id=re.compile('username'))
+        tag_input_password = soup.find('input', id=re.compile('password'))
+        if tag_input_login is None or tag_input_password is None:
+            raise ACSAuthenticationError('* Login form was not found on ACS.')
+
+        tag_form = tag_input_login.find_parent('form')
+        form_data = {
+            tag_input.get('name'): tag_input.get('value', str())
+            for tag_input in tag_form.find_all('input') if tag_input.get('name')
+        }
+        form_data.update({
+            tag_input_login.get('name'): kwargs.get('username'),
+            tag_input_password.get('name'): kwargs.get('password'),
+        })
+
+        response = self._request(session, 'POST',
+                                 urljoin(response.url, tag_form.get('action') or login_url),
+                                 data=form_data)
+        if '/site/login' in response.url:
+            raise ACSAuthenticationError('* ACS rejected the login or password.')
+        return response
+
+    def sidebar_links(self, response):
+        """ Resolve the sidebar links of the landing page.
+        """
+        soup = BeautifulSoup(response.text, 'html.parser')
+        tag_sidebar = soup.find(id='sidebar')
+        links = {}
+        for href_part in ACSParser.sidebar:
+            tag_a_self = tag_sidebar.find('a', href=re.compile(href_part)) if tag_sidebar else None
+            if tag_a_self is None:
+                raise ACSAuthenticationError(f'* Sidebar link {href_part} was not found on ACS.')
+            links[href_part] = urljoin(response.url, tag_a_self.get('href'))
+        return links
+
+    def open_page(self, session, href_part, params=None, **kwargs):
+        """ Open a sidebar page with the pooled session cookies of the
+            user, sign in again when ACS sends us back to the login form.
+        """
+        key = acs_sessions.key(**kwargs)
+        acs_session = acs_sessions.get(key)
+        if acs_session:
+            for cookie in acs_session.cookies:
+                session.cookies.set(cookie.get('name'), cookie.get('value'),
+                                    domain=cookie.get('domain'), path=cookie.get('path'))
+            response = self._request(session, 'GET',
+                                     acs_session.links.get(href_part), params=params)
+            if '/site/login' not in response.url:
+                return response
+            acs_sessions.invalidate(key)
+            session.cookies.clear()
+
+        links = self.sidebar_links(self.sign_in(session, **kwargs))
+        response = self._request(session, 'GET', links.get(href_part), params=params)
+        acs_sessions.put(key, [{
+            'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain,
+            'path': cookie.path, 'expiry': cookie.expires} for cookie in session.cookies
+        ], links)
+
+        return response
+
+    def schedule_markup(self, **kwargs):
+        """ Sign in, open 'self/time' and return the inner html
+            of the schedule table.
+        """
+        with self._create_session() as session:
+            response = self.open_page(session, 'self/time', **kwargs)
+
+        return self.time_markup(response)
+
+    def student_markup(self, tabs, year, semester, **kwargs):
+        """ Sign in, open 'self/student' for the year and semester
+            once and return the inner html of every tab in tabs.
+        """
+        with self._create_session() as session:
+            response = self.open_page(session, 'self/student',
+                                      params={'year': year, 'sem': semester}, **kwargs)
+
+        return self.tabs_markup(response, tabs)
+
+    def time_markup(self, response):
+        """ Inner html of the schedule table of 'self/time' page.
+        """
+        soup = BeautifulSoup(response.text, HTML_PARSER,
+                             parse_only=SoupStrainer('table', id=re.compile('time')))
+        return soup.find('table', id=re.compile('time')).decode_contents()
+
+    def tabs_markup(self, response, tabs):
+        """ Inner html of the tabs of 'self/student' page.
+        """
+        soup = BeautifulSoup(response.text, HTML_PARSER,
+                             parse_only=SoupStrainer('div', id=re.compile('tab_')))
+        return {
+            tab: soup.find('div', id=re.compile(f'tab_{tab}')).decode_contents()
+            for tab in tabs
+        }
+
+
+class ACSParser(object):
+    """ Custom and simple parser for ACS.
+    """
+    engines = {'phantom': ACSPhantomEngine, 'http': ACSHttpEngine}
+    sidebar = ('self/time', 'self/student')
+
+    _matchers = {
+        name: re.compile(f'({name})') for name in ('mh', 'cell', 'lesson', 'start', 'finish')
+    }
+    _strainers = {'schedule': SoupStrainer('tr')}
+
+    def __init__(self, engine=None):
+        engine_name = engine or constants.ACS_PARSER_ENGINE
+        if engine_name not in self.engines:
+            raise AttributeError(f'* Parser engine {engine_name} not implemented.')
+        self.engine = self.engines[engine_name]()
+
+    def __call__(self, parser_type):
+        return self.parse(parser_type)
+
     def parse(self, parser_type):
         """ Get parser, validate and parse received html.
         """
@@ -69,98 +378,97 @@ class ACSParser(object):
                 f'* Parser method _parse_{parser_type} not implemented.')
         return parser()
 
-    def parse_schedule(self, **kwargs):
-        from calendar import day_name      
+    def extract_schedule(self, markup):
+        """ Build the week schedule from the inner html of 'self/time' table.
+            Only the rows are parsed and every tag is visited once.
+        """
         result_schedule = dict({item: [] for item in tuple(day_name)})
+        matchers = self._matchers
         
-        def lessons_enumerate_scrape(day, td_element):
-            lesson_div_array  = td_element.find_all('div', {'class': re.compile('(mh)')})
+        def lessons_enumerate_scrape(td_element):
             lessons_enumerate = []
-            for div in lesson_div_array:
-                lessons_enumerate.append((
-                    f"{div.find('span', {'class': re.compile('(lesson)')}).text}\u002C"
-                    f"%(time_first)s"
-                    f"{div.find('span', {'class': re.compile('(start)')}).text }"
-                    f"%(time_second)s"
-                    f"{div.find('span', {'class': re.compile('(finish)')}).text}"))
+            for div in td_element.find_all('div', {'class': matchers.get('mh')}):
+                lesson_spans = {}
+                for span in div.find_all('span', {'class': True}):
+                    span_class = '\u0020'.join(span.get('class'))
+                    for name in ('lesson', 'start', 'finish'):
+                        if name not in lesson_spans and matchers.get(name).search(span_class):
+                            lesson_spans[name] = span.text
+                lessons_enumerate.append({
+                    "lesson_number": lesson_spans['lesson'],
+                    "time_start":    lesson_spans['start'],
+                    "time_finish":   lesson_spans['finish']})
 
             return lessons_enumerate 
 
-        def lessons_entity_scrape(day, td_element, lessons_enumerate):
+        def lessons_entity_scrape(lessons_day, td_element, lessons_enumerate):
             lesson_date = td_element.find('div').text
-            lesson_div_array = td_element.find_all('div', {'class': re.compile('(cell)')})          
+            lesson_div_array = td_element.find_all('div', {'class': matchers.get('cell')})
             for index_d, div in enumerate(lesson_div_array):           
                 try:
-                    lesson_text = div.find('div').text
                     lesson_text_list = [
-                        item.strip() for item in lesson_text.split('\n') if item
+                        item.strip().replace('(!)\u0020', str()).replace('...', str())
+                        for item in div.find('div').text.split('\n') if item
                     ]
-                    for index_t, _ in enumerate(lesson_text_list):
-                        lesson_text_list[index_t] = lesson_text_list[index_t]\
-                            .replace('(!)\u0020', str())\
-                            .replace('...', str())
-                
-                    lesson_subject = div.attrs.get('data-content')
                     lesson_subject_list = [
-                        item.strip() for item in lesson_subject.split('<br>') if item
+                        item.strip() for item in div.attrs.get('data-content').split('<br>') if item
                     ]
                     lesson_text_list.insert(0, lesson_subject_list[1])             
                 except AttributeError as error:
                     pass 
                 else:
+                    # plain fields, the captions are added by the templates
                     lesson_iter = iter(lesson_text_list)
-                    result_schedule.get(day).append({
-                        "lesson_date": f"%(lesson_date)s{lesson_date}\n",
-                        "lesson_enumerate": f"%(lesson_enumerate)s{lessons_enumerate[index_d]}\n",
-                        "lesson_subject": f"%(lesson_subject)s{next(lesson_iter, '...')}\n",
-                        "lesson_title": f"%(lesson_title)s{next(lesson_iter, '...')}\n",
-                        "lesson_text": (
-                            f"%(lesson_class)s{next(lesson_iter, '...')}\n"
-                            f"%(lesson_teach)s{next(lesson_iter, '...')}\n\n")
+                    lessons_day.append({
+                        "lesson_date":    lesson_date,
+                        **lessons_enumerate[index_d],
+                        "lesson_subject": next(lesson_iter, '...'),
+                        "lesson_title":   next(lesson_iter, '...'),
+                        "lesson_class":   next(lesson_iter, '...'),
+                        "lesson_teach":   next(lesson_iter, '...')
                     }) 
             return
 
-        try:
-            phantom = self._sign_in(**kwargs)
+        soup = BeautifulSoup(markup, HTML_PARSER, parse_only=self._strainers.get('schedule'))
+        for day, tr_element in zip(tuple(day_name), soup.find_all('tr')):
+            td_element_array = iter(tr_element.find_all('td'))
+            lessons_enumerate = lessons_enumerate_scrape(next(td_element_array))                
+            for td_element in td_element_array:
+                lessons_entity_scrape(result_schedule.get(day), td_element, lessons_enumerate)
 
-            tag_a_self = phantom.find_element_by_id('sidebar')\
-                                .find_element_by_xpath("//a[contains(@href, 'self/time')]")
-            phantom.get(f"{tag_a_self.get_attribute('href')}")
-            tag_table_time = phantom.find_element_by_xpath("//table[contains(@id, 'time')]")     
-            
-            soup = BeautifulSoup(tag_table_time.get_attribute('innerHTML'), 'html.parser')
-            tr_element_array = soup.find_all('tr')
-            for day, tr_element in zip(tuple(day_name), tr_element_array):
-                td_element_array = iter(tr_element.find_all('td'))
-                lessons_enumerate = lessons_enumerate_scrape(day, next(td_element_array))                
-                for td_element in td_element_array:
-                    lessons_entity_scrape(day, td_element, lessons_enumerate)
+        return result_schedule
+
+    def parse_schedule(self, **kwargs):
+        """ Scrape and save the schedule, returns whether the
+            scraped data differs from the stored one.
+        """
+        try:
+            result_schedule = self.extract_schedule(
+                self.engine.schedule_markup(**kwargs))
         except Exception as error:
             logger.exception(f'* Loading took too much time - {error}')
+            raise
         else:
-            from handlers.models.profiles import UserScheduleModel
-            from application import server
-            
-            server.app_context().push()
+            from handlers.models.profiles import UserLessonModel, UserScheduleModel
 
             user_schedule = UserScheduleModel.get_schedule_for_user(kwargs.get('id'))
             if not user_schedule:
-                user_schedule = UserScheduleModel(**{
-                    'user_id': kwargs.get('id'), 'schedule': result_schedule
-                })
-            user_schedule.last_update_datetime = now().to_datetime_string()
+                user_schedule = UserScheduleModel(**{'user_id': kwargs.get('id')})
+            changed = user_schedule.update_schedule(result_schedule)
             
             user_schedule.save()
-        finally:
-            phantom.service.process.send_signal(signal.SIGTERM)
-            phantom.quit()
+            from templates import rendered_views
+            rendered_views.invalidate(kwargs.get('from_user_id'), 'schedule',
+                                      user_schedule.schedule_digest)
+            UserLessonModel.index_lessons(kwargs.get('from_user_id'), UserLessonModel.intervals_from_rows(
+                UserLessonModel.rows_from_schedule(user_schedule.user_id, result_schedule)))
+            return changed
 
     _tabs = {'rating': 1, 'module': 3}
 
-    def parse_rating(self, **kwargs):
-        from handlers.models.profiles import UserRatingModel
-        from application import server
-        
+    def extract_rating(self, markup):
+        """ Build the rating list from the inner html of the rating tab.
+        """
         def lessons_scrape(index, div_element):          
             lesson_caption = div_element.find(
                 'div', {'class': re.compile('(accordion-heading)')}).text
@@ -204,77 +512,70 @@ class ACSParser(object):
                     'lesson_enumerate': lesson_enumerate,
                 }
             })           
-            
-        server.app_context().push()
 
-        user_rating = UserRatingModel.get_results_for_user(kwargs.get('id'))
-        if not user_rating: return
+        soup = BeautifulSoup(markup, 'html.parser')
+        div_element_array = soup.find_all('div', {'class': re.compile('(accordion-group)')})
+        result_rating = []
+        for  div_element in div_element_array:
+            if div_element.find('table'): result_rating.append(lessons_scrape(
+                len(result_rating) + 1, div_element)
+            )          
 
-        try:
-            phantom = self._sign_in(**kwargs)
-
-            tag_a_self = phantom.find_element_by_id('sidebar')\
-                .find_element_by_xpath("//a[contains(@href, 'self/student')]")
-            phantom.get((f"{tag_a_self.get_attribute('href')}?"
-                         f"year={user_rating.choosed_year }&sem={user_rating.choosed_semester}"))
-            tag_tab_acc_journal = phantom.find_element_by_xpath(f"//div[contains(@id, 'tab_{self._tabs.get('rating')}')]")     
-
-            soup = BeautifulSoup(tag_tab_acc_journal.get_attribute('innerHTML'), 'html.parser')
-            div_element_array = soup.find_all('div', {'class': re.compile('(accordion-group)')})
-            result_rating = []
-            for  div_element in div_element_array:
-                if div_element.find('table'): result_rating.append(lessons_scrape(
-                    len(result_rating) + 1, div_element)
-                )          
-        except Exception as error:
-            logger.exception(f'* Loading took too much time - {error}')
-        else:
-            user_rating.rating = result_rating
-            user_rating.last_update_datetime = now().to_datetime_string()
-            
-            user_rating.save()
-        finally:
-            phantom.service.process.send_signal(signal.SIGTERM)
-            phantom.quit()
+        return result_rating
 
-    def parse_module(self, **kwargs):
+    def extract_module(self, markup):
+        """ Build the module list from the inner html of the module tab.
+        """
+        soup = BeautifulSoup(markup, 'html.parser')
+        tr_element_array = soup.find('tbody').find_all('tr')
+        result_module = []
+        for tr_element in tr_element_array:
+            td_element_array = iter(tr_element.find_all('td'))
+            result_module.append({
+                'lesson_title':  next(td_element_array, str()).text,
+                'module_first':  next(td_element_array, str()).text,
+                'module_second': next(td_element_array, str()).text
+            })
+
+        return result_module
+
+    def parse_results(self, **kwargs):
+        """ Scrape rating and module from a single 'self/student'
+            page load and save both in one transaction, year and
+            semester - the period asked for, the chosen one by default
+        """
         from handlers.models.profiles import UserRatingModel
-        from application import server
-        
-        server.app_context().push()
 
-        user_module = UserRatingModel.get_results_for_user(kwargs.get('id'))
-        if not user_module: return
+        user_results = UserRatingModel.get_results_for_user(kwargs.get('id'))
+        if not user_results: return
 
+        year = kwargs.pop('year', None)
+        year = user_results.choosed_year if year is None else year
+        semester = kwargs.pop('semester', None)
+        semester = user_results.choosed_semester if semester is None else semester
         try:
-            phantom = self._sign_in(**kwargs)
-
-            tag_a_self = phantom.find_element_by_id('sidebar')\
-                .find_element_by_xpath("//a[contains(@href, 'self/student')]")
-            phantom.get((f"{tag_a_self.get_attribute('href')}?"
-                         f"year={user_module.choosed_year }&sem={user_module.choosed_semester}"))
-            tag_tab_table = phantom.find_element_by_xpath(f"//div[contains(@id, 'tab_{self._tabs.get('module')}')]")     
-
-            soup = BeautifulSoup(tag_tab_table.get_attribute('innerHTML'), 'html.parser')
-            tr_element_array = soup.find('tbody').find_all('tr')
-            result_module = []
-            for tr_element in tr_element_array:
-                td_element_array = iter(tr_element.find_all('td'))
-                result_module.append({
-                    'lesson_title':  next(td_element_array, str()).text,
-                    'module_first':  next(td_element_array, str()).text,
-                    'module_second': next(td_element_array, str()).text
-                })
+            markups = self.engine.student_markup(
+                (self._tabs.get('rating'), self._tabs.get('module')), year, semester, **kwargs)
+            result_rating = self.extract_rating(markups.get(self._tabs.get('rating')))
+            result_module = self.extract_module(markups.get(self._tabs.get('module')))
         except Exception as error:
             logger.exception(f'* Loading took too much time - {error}')
+            raise
         else:
-            user_module.module = result_module
-            user_module.last_update_datetime = now().to_datetime_string()
-
-            user_module.save()
-        finally:
-            phantom.service.process.send_signal(signal.SIGTERM)
-            phantom.quit()
-
-
+            changed = user_results.update_results(rating=result_rating,
+                                                  module=result_module)
+            user_results.results_year = year
+            user_results.results_semester = semester
+            user_results.results_update_datetime = now().to_datetime_string()
+
+            user_results.save()
+            from templates import rendered_views
+            for kind in ('rating', 'module'):
+                rendered_views.invalidate(kwargs.get('from_user_id'), kind,
+                                          getattr(user_results, f'{kind}_digest'))
+            return changed
+
+
+acs_sessions = ACSSessionPool(ttl=constants.ACS_SESSION_TTL,
+                              memory_limit=constants.ACS_SESSIONS_MEMORY_LIMIT)
 acs_parser = ACSParser()
@@ -0,0 +1,135 @@
+import time
+from datetime import datetime, timedelta
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+
+from settings import constants, logger
+
+
+class ScheduleRefresher(object):
+    """ Off-peak bulk refresh of the schedules nearing expiry.
+        A run is started by the cron expression, refreshes one user
+        at a time at a bounded rate until the window closes and records
+        the last refreshed user, so an interrupted run resumes there
+    """
+    name = 'schedule'
+
+    def __init__(self, thread_pool, flights, cron, window, rate, margin, batch=100):
+        self.thread_pool = thread_pool
+        self.flights = flights
+        self.cron = cron
+        self.window = window
+        self.rate = rate
+        self.margin = margin
+        self.batch = batch
+        self.trigger = self.cron_trigger(cron)
+        self.scheduler = BackgroundScheduler(daemon=True)
+
+    @staticmethod
+    def cron_trigger(cron):
+        """ Trigger of 'minute hour day month day_of_week', the days of
+            week are names only ('mon-fri'), APScheduler counts the
+            numbered ones from Monday and crontab from Sunday
+        """
+        minute, hour, day, month, day_of_week = cron.split()
+        if any(symbol.isdigit() for symbol in day_of_week):
+            raise ValueError(f'* Cron {cron}: name the days of week, not number them.')
+        return CronTrigger(minute=minute, hour=hour, day=day,
+                           month=month, day_of_week=day_of_week)
+
+    def start(self):
+        self.scheduler.add_job(self.run, self.trigger,
+                               id=self.name, max_instances=1, coalesce=True)
+        self.scheduler.start()
+
+    def shutdown(self):
+        self.scheduler.shutdown(wait=False)
+
+    def window_end(self, moment=None):
+        """ End of the off-peak window the moment falls into,
+            None when the moment is outside of any window
+        """
+        # the fire times of the same trigger the job is scheduled by
+        moment = self.trigger.timezone.localize(moment or datetime.now())
+        window_start, fire_time = None, self.trigger.get_next_fire_time(None, moment - self.window)
+        while fire_time is not None and fire_time <= moment:
+            window_start = fire_time
+            fire_time = self.trigger.get_next_fire_time(fire_time, fire_time + timedelta(seconds=1))
+        if window_start is None: return
+        return (window_start + self.window).astimezone(self.trigger.timezone).replace(tzinfo=None)
+
+    def run(self, force=False):
+        """ Feed expiring schedules to the pool until the window closes,
+            force - ignore the window (e.g. run from the command line)
+        """
+        from application import request_scopes
+        from handlers.models.profiles import RefreshProgressModel, UserScheduleModel
+        from parsers import acs_parser
+
+        window_end = datetime.max if force else self.window_end()
+        if window_end is None:
+            logger.info(f'* Refresh {self.name}: outside of the off-peak window.')
+            return
+
+        with request_scopes() as session:
+            progress = RefreshProgressModel.get_progress(self.name) or \
+                RefreshProgressModel(name=self.name)
+            if progress.interrupted:
+                logger.info(f'* Refresh {self.name}: resume after user {progress.last_user_id}.')
+            else:
+                progress.begin()
+            progress.save()
+
+            expire_before = datetime.now() + self.margin - \
+                timedelta(days=constants.SCHEDULE_ACTUAL_DAYS)
+            while datetime.now() < window_end:
+                user_schedules = UserScheduleModel.get_expiring_schedules(
+                    expire_before, after_user_id=progress.last_user_id, limit=self.batch)
+                if not user_schedules:
+                    progress.finish()
+                    progress.save()
+                    logger.info(f'* Refresh {self.name}: done, '
+                                f'{progress.refreshed_count} schedules refreshed.')
+                    break
+
+                credentials = [(user_schedule.user_id, self.credentials(user_schedule))
+                               for user_schedule in user_schedules]
+                # no transaction is kept open while the goals run and sleep
+                session.commit()
+
+                for user_id, kwargs in credentials:
+                    if datetime.now() >= window_end: break
+                    refreshed = self.refresh(kwargs, acs_parser)
+                    # saved once the goal is over, a restart repeats the unfinished one
+                    progress.advance(user_id, refreshed=refreshed)
+                    progress.save()
+                    # bounded rate, leave the pool for the users awake at night
+                    if refreshed: time.sleep(1 / self.rate)
+
+    def credentials(self, user_schedule):
+        user_profile = user_schedule.schedule_owner
+        if not (user_profile and user_profile.username and user_profile.password):
+            return
+        kwargs = user_profile.to_dict()
+        kwargs.update({
+            'password': user_profile.get_password(user_profile.from_user_id)}
+        )
+        return kwargs
+
+    def refresh(self, kwargs, acs_parser) -> bool:
+        """ Scrape the schedule and wait for it, under the same flight
+            key as the scrape requested by the student
+        """
+        if not kwargs: return False
+        parser_engine = acs_parser.parse_schedule
+
+        def refresh_engine():
+            return self.thread_pool.add_goal(parser_engine, **kwargs).result(
+                timeout=constants.PHANTOMJS_GOAL_TIMEOUT)
+        try:
+            self.flights.do((kwargs.get('id'), parser_engine.__name__), refresh_engine)
+        except Exception as error:
+            logger.exception(f'{error}')
+            return False
+        return True
@@ -0,0 +1,85 @@
+from collections import namedtuple
+
+from settings import logger
+
+
+class CallbackCodec(object):
+    """ Compact callback_data with the rating navigation state:
+        'prefix:y2017:s0:p2:l7', so the menus need no database
+        writes to remember the chosen year, semester and page.
+        Untagged arguments of the old buttons ('page_rating:2',
+        'lesson_rating:2:7') are taken as page and lesson
+    """
+    limit = 64
+    fields = namedtuple('CallbackFields', 'year semester page lesson')
+    tags = {'y': 'year', 's': 'semester', 'p': 'page', 'l': 'lesson'}
+    untagged = ('page', 'lesson')
+
+    @classmethod
+    def encode(cls, prefix, **kwargs) -> str:
+        tags = {field: tag for tag, field in cls.tags.items()}
+        data = ':'.join([prefix, *(
+            f'{tags[field]}{int(kwargs[field])}' for field in cls.fields._fields
+            if kwargs.get(field) is not None)]
+        )
+        if len(data.encode()) > cls.limit:
+            raise ValueError(f'callback_data {data} is longer than {cls.limit} bytes')
+        return data
+
+    @classmethod
+    def decode(cls, data):
+        _, *arguments = f'{data}'.split(':')
+        kwargs, untagged = {}, iter(cls.untagged)
+        for argument in arguments:
+            if argument.isdigit():
+                field = next(untagged, None)
+                if field: kwargs[field] = int(argument)
+            elif argument[:1] in cls.tags and argument[1:].isdigit():
+                kwargs[cls.tags[argument[:1]]] = int(argument[1:])
+        return cls.fields(**{field: kwargs.get(field) for field in cls.fields._fields})
+
+    @classmethod
+    def replace(cls, data, prefix, **kwargs) -> str:
+        """ Keep the state of data for the next button
+        """
+        fields = cls.decode(data)._replace(**kwargs)
+        return cls.encode(prefix, **fields._asdict())
+
+
+class CallbackRouter(object):
+    """ Dispatcher of the callback queries. callback_data is
+        'prefix[:argument[:argument]]', the prefix is split off once
+        and the handler is taken from a dict, no predicate chain
+    """
+    separator = ':'
+
+    def __init__(self):
+        self.routes = {}
+        self.numeric = None
+
+    def route(self, *prefixes, numeric=False):
+        """ Register the handler for the prefixes, numeric - also
+            for bare numbers (legacy buttons with a year only)
+        """
+        def decorator(func):
+            for prefix in prefixes: self.routes[prefix] = func
+            if numeric: self.numeric = func
+            return func
+        return decorator
+
+    def resolve(self, data):
+        prefix, *_ = f'{data}'.split(self.separator, 1)
+        handler = self.routes.get(prefix)
+        if handler is None and prefix.isdigit():
+            return self.numeric
+        return handler
+
+    def __call__(self, cb_function):
+        handler = self.resolve(cb_function.data)
+        if handler is None:
+            logger.warning(f'* Callback {cb_function.data} has no route.')
+            return
+        return handler(cb_function)
+
+
+callback_router = CallbackRouter()
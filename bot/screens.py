@@ -0,0 +1,48 @@
+from calendar import day_name
+from collections import namedtuple
+
+from languages.language import languages_challenge, support_languages
+from menus import menus_challenge
+from templates import CompiledByLanguage
+
+Screen = namedtuple('Screen', 'text reply_markup')
+
+
+class LanguageScreens(object):
+    """ The screens that depend on the language only, the text and
+        the serialized reply_markup are ready to be sent as they are
+    """
+
+    def __init__(self, lang_storage):
+        self.lang_storage = lang_storage
+        messages, menus = lang_storage['messages'], menus_challenge
+
+        def backward(text):
+            return Screen(f'{text}', menus.create_backward_menu(
+                lang_storage, cb_data=str('handle_button_main_menu')).to_json())
+
+        self.main_menu = Screen(
+            f"{messages.get('message_welcome')}\n{messages.get('message_select_menu')}",
+            menus.create_main_menu(lang_storage).to_json())
+        self.updates = backward(messages.get('message_updates'))
+        self.feedback = backward(messages.get('message_feedback'))
+        self.user_exists = backward(messages.get('message_user_exists'))
+        self.oops = backward(messages.get('message_oops'))
+        self.settings = Screen(
+            f"{messages.get('message_settings')}",
+            menus.create_settings_menu(lang_storage, cb_data=(
+                'handle_button_self_add', 'handle_button_self_delete',
+                'handle_button_main_menu')).to_json())
+        # the text is formatted with the user name
+        self.greeting = Screen(
+            f"{messages.get('message_greeting')}",
+            menus.create_yes_no_menu(lang_storage, cb_data=(
+                'handle_button_self_add', 'handle_button_self_no')).to_json())
+        self.days_of_week = Screen(
+            f"{messages.get('message_day_of_week')}",
+            menus.create_days_of_week_menu(lang_storage, cb_data=tuple(
+                f'handle_button_days_of_week:{day}' for day in day_name)).to_json())
+
+
+static_screens = CompiledByLanguage(languages_challenge, LanguageScreens)
+static_screens.warm_up(support_languages)
@@ -50,6 +50,12 @@ constants.WEBHOOK_LISTEN_HOST = 'localhost'  # In some VPS you may need to put h
 constants.WEBHOOK_LISTEN_PORT = 8080
 constants.WEBHOOK_SETUP_WAIT = 5
 constants.WEBHOOK_SETUP_PRIORITY = 1
+constants.WEBHOOK_ASYNC_MODE = True  # answer 200 at once, run the handlers in the background
+constants.WEBHOOK_LANES_COUNT = 16  # serial lanes, updates of one chat keep their order
+constants.WEBHOOK_QUEUE_SIZE = 1000  # shared by all lanes
+constants.UPDATES_DEDUP_WINDOW = 60 * 60  # seconds an update id is remembered
+constants.UPDATES_DEDUP_LIMIT = 100000
+constants.UPDATES_DEDUP_DATABASE = False  # share update ids through postgres (several processes)
 constants.WEBHOOK_SSL_CERT = f'{constants.BASE_DIR}/significant/webhook_cert.pem'  # Path to the ssl certificate
 constants.WEBHOOK_SSL_PRIV = f'{constants.BASE_DIR}/significant/webhook_pkey.pem'  # Path to the ssl private key
 constants.CREDENTIALS_FILE = f'{constants.BASE_DIR}/significant/configurations.pty'
@@ -63,17 +69,46 @@ constants.WEBHOOK_URL_BASE = f'https://{constants.WEBHOOK_HOST}:{constants.WEBHO
 constants.WEBHOOK_URL_PATH = f'/{constants.API_TOKEN}/'
 
 constants.LANGUAGES_FILE = f'{constants.BASE_DIR}/languages/dialogs.json'
+constants.LANGUAGES_RELOAD_INTERVAL = 5  # seconds between the file mtime checks
 
 constants.PHANTOMJS_EXEC = f'{constants.BASE_DIR}/phantom/phantomjs'
 constants.PHANTOMJS_QUEUE_TIMEOUT   = 10
 constants.PHANTOMJS_THREADS_COUNT   = 15
 constants.PHANTOMJS_IMPLICITLY_WAIT = 10
+constants.PHANTOMJS_DRIVERS_COUNT   = 15
+constants.PHANTOMJS_DRIVER_USES     = 50  # goals served before a driver is recycled
+constants.PHANTOMJS_DRIVER_RSS_LIMIT = 300 * 1024 * 1024  # bytes
+constants.PHANTOMJS_LEASE_TIMEOUT   = 60
+constants.PHANTOMJS_RESPAWN_WAIT    = 5
+constants.PHANTOMJS_GOAL_TIMEOUT    = 90  # seconds a user waits for the scrape result
+constants.SCRAPE_FLIGHT_TIMEOUT     = 120  # seconds a duplicate request waits for the running scrape
 
 constants.ACS_BASE_URL = 'https://acadreg.nmu.ua'
+constants.ACS_PARSER_ENGINE = 'phantom'  # 'phantom' - PhantomJS browser, 'http' - browserless requests
+constants.ACS_REQUEST_TIMEOUT = 10
+constants.ACS_VERIFY_SSL = True  # True or the path of the ACS CA bundle, never off: passwords are posted
+constants.ACS_TIMEZONE = 'Europe/Kiev'  # the schedule times are wall-clock times of the university
+constants.ACS_USER_AGENT = 'Mozilla/5.0 (compatible; RahRahNMUBot/1.0)'
+constants.ACS_SESSION_TTL = 20 * 60  # seconds an authenticated ACS session is reused
+constants.ACS_SESSIONS_MEMORY_LIMIT = 4 * 1024 * 1024  # bytes of cookies kept in the pool
 constants.SCHEDULE_ACTUAL_DAYS = 3
+constants.RESULTS_ACTUAL_MINUTES = 30
+constants.SCHEDULE_REFRESH_ENABLED = True
+constants.SCHEDULE_REFRESH_CRON = '0 1 * * *'  # off-peak window start
+constants.SCHEDULE_REFRESH_WINDOW_HOURS = 5
+constants.SCHEDULE_REFRESH_MARGIN_HOURS = 24  # refresh schedules expiring within it
+constants.SCHEDULE_REFRESH_RATE = 0.5  # goals per second
+constants.SCHEDULE_REFRESH_BATCH = 100
 constants.PERIOD_OF_STUDY = 6
 constants.SEMESTERS = {'Autumn': 0, 'Spring': 1}
 constants.PAGES_COUNT = 5
+constants.PAGES_INDEX_CACHE_SIZE = 1000  # pages indexes of the rating/module contents
+constants.RENDERED_VIEWS_USERS = 10000  # users with the rendered views kept
+constants.RENDERED_VIEWS_PER_USER = 32
+constants.PROFILES_CACHE_TTL = 30  # seconds a loaded profile is reused across updates, 0 - off
+constants.PROFILES_CACHE_LIMIT = 10000
+constants.LESSONS_INDEX_TTL = 86400  # seconds an index is kept unless its schedule goes stale first
+constants.LESSONS_INDEX_LIMIT = 10000
 
 
 class NoValue(Enum):
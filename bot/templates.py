@@ -0,0 +1,295 @@
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from weakref import WeakKeyDictionary
+
+from helpers import content_digest, split_sections
+from languages.language import languages_challenge
+from settings import constants
+
+tab = '\t'
+
+
+class TemplateFields(object):
+    """ Fields of the scraped item for str.format_map, an absent
+        or empty field is shown as the 'empty data' message
+    """
+    __slots__ = ('item', 'empty')
+
+    def __init__(self, item, empty):
+        self.item, self.empty = item, empty
+
+    def __getitem__(self, key):
+        return self.item.get(key) or self.empty
+
+
+class LanguageTemplates(object):
+    """ Templates of one language, the messages are put into the
+        sources once, so a render is a format_map call per item
+    """
+    sources = {
+        'schedule_caption': '%(message_lesson_caption)s',
+        'schedule_lesson': (
+            f'<b>{4*tab}%(message_lesson_date)s{{lesson_date}}\n</b>'
+            f'%(message_lesson_title)s{{lesson_title}}\n'
+            f'%(message_lesson_subject)s{{lesson_subject}}\n'
+            f'{4*tab}%(message_lesson_enumerate)s{{lesson_number}},'
+            f'%(message_lesson_from)s{{time_start}}%(message_lesson_to)s{{time_finish}}\n'
+            f'{8*tab}%(message_lesson_class)s{{lesson_class}}\n'
+            f'{8*tab}%(message_lesson_teach)s{{lesson_teach}}\n\n'),
+        'lessons_now_caption': '%(message_lessons_now)s',
+        'lessons_next_caption': '%(message_lessons_next)s',
+        'lessons_today_caption': '%(message_lessons_today)s',
+        'lessons_empty': f'{4*tab}<b>%(message_empty_data)s</b>',
+        'rating_caption': '%(message_rating_caption)s',
+        'rating_page_lesson': '<b>{lesson_number}.</b> {lesson_caption}\n\n',
+        'rating_lesson_caption': '<b>{lesson_caption}</b>\n\n',
+        'rating_lesson_item': (
+            f'{4*tab}<b>%(message_rating_title)s</b>{{lesson_title}}\n'
+            f'{8*tab}<b>%(message_rating_presence_rating)s{{lesson_presence}}</b>'
+            f', {{lesson_rating}}\n\n'),
+        'rating_lesson_empty': f'{4*tab}<b>%(message_empty_data)s</b>',
+        'module_caption': '%(message_module_caption)s',
+        'module_lesson': (
+            '<b>\u00b7\u0020{lesson_title}</b>\n'
+            f'{4*tab}%(message_module_first)s - <b>{{module_first}}</b>\n'
+            f'{4*tab}%(message_module_second)s - <b>{{module_second}}</b>\n\n'),
+    }
+
+    def __init__(self, lang_storage):
+        self.lang_storage = lang_storage
+        self.empty = lang_storage['messages'].get('message_empty_data')
+        messages = {
+            key: f'{value}'.replace('{', '{{').replace('}', '}}')
+            for key, value in lang_storage['messages'].items()
+        }
+        for name, source in self.sources.items():
+            setattr(self, name, source % messages)
+
+    def fields(self, item):
+        return TemplateFields(item, self.empty)
+
+    def schedule(self, lessons) -> str:
+        fields, lesson = self.fields, self.schedule_lesson
+        return ''.join([self.schedule_caption, *(
+            lesson.format_map(fields(item)) if 'lesson_number' in item else
+            self.legacy_schedule_lesson(item) for item in lessons)]
+        )
+
+    def lessons(self, kind, lessons) -> str:
+        """ kind - now, next or today, lessons - the template fields
+        """
+        fields, lesson = self.fields, self.schedule_lesson
+        return ''.join([getattr(self, f'lessons_{kind}_caption'), *(
+            [lesson.format_map(fields(item)) for item in lessons] or [self.lessons_empty])]
+        )
+
+    def legacy_schedule_lesson(self, lesson) -> str:
+        """ The lesson saved before the structured fields, with the
+            '%(lesson_title)s' placeholders filled at render time
+        """
+        messages = self.lang_storage['messages']
+        return ''.join([
+            f"<b>{4*tab}{lesson.get('lesson_date')}</b>" % {
+                'lesson_date': messages.get('message_lesson_date')},
+            f"{lesson.get('lesson_title')}" % {
+                'lesson_title': messages.get('message_lesson_title')},
+            f"{lesson.get('lesson_subject')}" % {
+                'lesson_subject': messages.get('message_lesson_subject')},
+            f"{4*tab}{lesson.get('lesson_enumerate')}" % {
+                'lesson_enumerate': messages.get('message_lesson_enumerate'),
+                'time_first':       messages.get('message_lesson_from'),
+                'time_second':      messages.get('message_lesson_to')},
+            f"{lesson.get('lesson_text')}" % {
+                'lesson_class': f"{8*tab}{messages.get('message_lesson_class')}",
+                'lesson_teach': f"{8*tab}{messages.get('message_lesson_teach')}"}
+        ])
+
+    def rating_page(self, lessons) -> str:
+        """ lessons - pairs of the lesson number and caption
+        """
+        line = self.rating_page_lesson
+        return ''.join([self.rating_caption, *(
+            line.format(lesson_number=number, lesson_caption=caption.strip())
+            for number, caption in lessons)]
+        )
+
+    def rating_lesson(self, lesson) -> str:
+        fields, item = self.fields, self.rating_lesson_item
+        return ''.join([
+            self.rating_lesson_caption.format(lesson_caption=lesson.get('lesson_caption').strip()),
+            *(item.format_map(fields(element)) for element in lesson.get('lesson_enumerate') or ()),
+            '' if lesson.get('lesson_enumerate') else self.rating_lesson_empty]
+        )
+
+    def module(self, lessons) -> str:
+        fields, lesson = self.fields, self.module_lesson
+        return ''.join([self.module_caption, *(
+            lesson.format_map(fields(item)) for item in lessons)]
+        )
+
+
+class CompiledByLanguage(object):
+    """ Objects compiled from the language data by the compiler,
+        one per language code, on the first use and again after
+        the language catalog reload
+    """
+
+    def __init__(self, languages, compiler):
+        self.languages = languages
+        self.compiler = compiler
+        self.generation = None
+        self.compiled = {}
+
+    def __call__(self, language_code):
+        lang_storage = self.languages(language_code)
+        if self.generation != self.languages.generation:
+            self.compiled, self.generation = {}, self.languages.generation
+
+        lcode = self.languages._get_language_code(language_code)
+        compiled = self.compiled.get(lcode)
+        if compiled is None or compiled.lang_storage is not lang_storage:
+            compiled = self.compiled[lcode] = self.compiler(lang_storage)
+        return compiled
+
+    def warm_up(self, language_codes):
+        for language_code in language_codes: self(language_code)
+
+
+class PagesIndex(object):
+    """ Rating or module split into the pages once, keeps the lesson
+        captions of every rating page and the rendered pages per language
+    """
+
+    def __init__(self, kind, items, per_page):
+        self.kind = kind
+        self.pages = split_sections(items, round(len(items) / per_page) or 1)
+        self.rendered = WeakKeyDictionary()
+        self.captions = []
+        if kind == 'rating':
+            # rating items are {'<number>': {'lesson_caption': ..., ...}}
+            for page in self.pages:
+                captions = []
+                for item in page:
+                    (number, lesson), *_ = item.items()
+                    captions.append((int(number), lesson.get('lesson_caption')))
+                self.captions.append(captions)
+
+    @property
+    def count(self) -> int:
+        return len(self.pages)
+
+    def lessons_range(self, page):
+        captions = self.captions[page - 1]
+        return min(captions)[0], max(captions)[0]
+
+    def text(self, page, templates) -> str:
+        """ Rendered page, page is numbered from 1
+        """
+        if not 1 <= page <= self.count: raise IndexError(f'* No page {page} of {self.count}.')
+        rendered = self.rendered.get(templates)
+        if rendered is None: rendered = self.rendered[templates] = {}
+        if page not in rendered:
+            rendered[page] = templates.rating_page(self.captions[page - 1]) \
+                if self.kind == 'rating' else templates.module(self.pages[page - 1])
+        return rendered[page]
+
+
+class PagesIndexes(object):
+    """ LRU of the pages indexes by the kind and the content digest,
+        so a page flip is a lookup instead of a split of the content
+    """
+
+    def __init__(self, limit, per_page):
+        self.limit = limit
+        self.per_page = per_page
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, kind, digest, load) -> PagesIndex:
+        """ Index of the content with the digest, load() gives the
+            content only when the index is missing, None - no content
+        """
+        with self.lock:
+            index = self.indexes.get((kind, digest)) if digest else None
+            if index is not None:
+                self.indexes.move_to_end((kind, digest)); return index
+
+        items = load()
+        if not items: return
+        key = (kind, digest or content_digest(items))
+        index = PagesIndex(kind, items, self.per_page)
+        with self.lock:
+            self.indexes[key] = index
+            while len(self.indexes) > self.limit: self.indexes.popitem(last=False)
+        return index
+
+
+class RenderedViews(object):
+    """ Per user LRU of the rendered views (text and serialized
+        reply_markup). view is a tuple, its first item is the kind of
+        data it is rendered from ('schedule', 'rating', 'module'),
+        parsers invalidate the kind when they save a new content
+    """
+    View = namedtuple('RenderedView', 'digest text reply_markup expires_at')
+
+    def __init__(self, users_limit, views_limit):
+        self.users_limit = users_limit
+        self.views_limit = views_limit
+        self.users = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, user_id, view, language_code):
+        key = (view, language_code)
+        with self.lock:
+            views = self.users.get(f'{user_id}')
+            rendered = views.get(key) if views else None
+            if rendered and rendered.expires_at and rendered.expires_at <= datetime.now():
+                views.pop(key); rendered = None
+            if rendered is None:
+                self.misses += 1; return
+
+            self.users.move_to_end(f'{user_id}'); views.move_to_end(key)
+            self.hits += 1
+            return rendered
+
+    def put(self, user_id, view, language_code, digest, text, reply_markup, expires_at=None):
+        """ expires_at - the view shows the data as fresh until then
+        """
+        rendered = self.View(digest, text, reply_markup, expires_at)
+        with self.lock:
+            views = self.users.get(f'{user_id}')
+            if views is None: views = self.users[f'{user_id}'] = OrderedDict()
+            views[(view, language_code)] = rendered
+            while len(views) > self.views_limit: views.popitem(last=False)
+            self.users.move_to_end(f'{user_id}')
+            while len(self.users) > self.users_limit: self.users.popitem(last=False)
+        return rendered
+
+    def invalidate(self, user_id, kind, digest=None):
+        """ Drop the views of the kind rendered from other content
+            than the digest one
+        """
+        with self.lock:
+            views = self.users.get(f'{user_id}')
+            if not views: return
+            for key in [key for key, rendered in views.items()
+                        if key[0][0] == kind and (digest is None or rendered.digest != digest)]:
+                views.pop(key)
+
+    def forget(self, user_id):
+        with self.lock: self.users.pop(f'{user_id}', None)
+
+    @property
+    def stats(self) -> dict:
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'users': len(self.users),
+                    'views': sum(len(views) for views in self.users.values())}
+
+
+message_templates = CompiledByLanguage(languages_challenge, LanguageTemplates)
+pages_indexes = PagesIndexes(limit=constants.PAGES_INDEX_CACHE_SIZE,
+                             per_page=constants.PAGES_COUNT)
+rendered_views = RenderedViews(users_limit=constants.RENDERED_VIEWS_USERS,
+                               views_limit=constants.RENDERED_VIEWS_PER_USER)